@@ -0,0 +1,83 @@
+"""
+Micro-benchmark: row-by-row vs columnar parse_widget_data
+
+Usage:
+    python benchmarks/bench_parse.py [recorded_payload.json] [--rows N] [--repeat R]
+
+Without a recorded payload, a "Stock List"-shaped payload is synthesized.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import market_health_fetcher as mhf
+
+
+def synth_payload(n_rows):
+    """Fake widget/process response shaped like the Stock List query"""
+    groups = []
+    for i in range(n_rows):
+        close = random.uniform(10, 5000)
+        high = close * random.uniform(1.0, 1.6)
+        groups.append({
+            "name": f"STOCK{i}",
+            "results": [{
+                "stock name": [f"STOCK{i}"],
+                "price": [close],
+                "% change": [random.uniform(-10, 10)],
+                "52w high": [high if i % 50 else mhf.NA_SENTINEL],
+                "distance 52w high": [(high - close) / high * 100],
+                "market cap": [random.uniform(100, 100000)],
+            }],
+        })
+    return {"groupData": groups}
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("payload", nargs="?", help="recorded widget/process JSON")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload) as f:
+            data = json.load(f)
+    else:
+        data = synth_payload(args.rows)
+
+    groups = data["groupData"]
+    rows_df = mhf._parse_widget_rows(groups)
+    cols_df = mhf._parse_widget_columns(groups)
+    if cols_df is None:
+        print("⚠️  Payload has an irregular layout - columnar path not used")
+        return
+    pd.testing.assert_frame_equal(rows_df, cols_df)
+
+    t_rows = best_of(lambda: mhf._parse_widget_rows(groups), args.repeat)
+    t_cols = best_of(lambda: mhf._parse_widget_columns(groups), args.repeat)
+
+    print(f"📊 {len(groups)} rows x {cols_df.shape[1]} columns (best of {args.repeat})")
+    print(f"   row-by-row: {t_rows * 1000:8.2f} ms")
+    print(f"   columnar:   {t_cols * 1000:8.2f} ms")
+    print(f"   speedup:    {t_rows / t_cols:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
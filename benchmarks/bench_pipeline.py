@@ -0,0 +1,188 @@
+"""
+Offline benchmark of the fetch -> parse -> write -> upload pipeline
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scales 1,10,100] [--recordings DIR]
+                                        [--save results.json] [--baseline results.json]
+
+Everything runs against the local stub (stub_server.py), replaying recorded
+responses (record.py) or synthesized ones. For every payload scale it times
+parse_widget_data, the output writers and a full update_excel_file cycle,
+then reports throughput and peak traced memory. With --baseline, exits 1
+when any benchmark is slower or heavier than the baseline by more than
+--tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_health_fetcher as mhf
+from record import RECORDINGS_DIR
+from stub_server import point_fetcher_at, start_stub
+
+
+def parse_all(bodies):
+    return {name: mhf.parse_widget_data(json.loads(body)) for name, body in bodies.items()}
+
+
+def make_sheets(frames):
+    sheets = {}
+    for name, df in frames.items():
+        if df is not None and not df.empty:
+            sheet = df.copy()
+            sheet.insert(0, 'Icon', mhf.QUERIES[name]['icon'])
+            sheets[name] = sheet
+    return sheets
+
+
+def write_outputs(frames, sheets):
+    now = mhf.datetime.now(mhf.IST)
+    if "xlsx" in mhf.OUTPUT_FORMATS:
+        mhf.write_workbook(sheets, now)
+    if any(f in mhf.OUTPUT_WRITERS for f in mhf.OUTPUT_FORMATS):
+        mhf.artifact_hashes.clear()
+        results = [(name, mhf.QUERIES[name], frames[name], None, False) for name in frames]
+        hashes = {name: mhf.sheet_hash(frames[name]) for name in sheets}
+        mhf.write_artifacts(results, sheets, hashes, now)
+
+
+def run_cycle():
+    """One cold update_excel_file cycle - nothing cached, everything uploaded"""
+    mhf.query_cache = mhf.QueryCache()
+    mhf.uploaded_hashes = None
+    mhf.artifact_hashes.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if not mhf.update_excel_file():
+            raise RuntimeError("update_excel_file failed")
+
+
+def measure(fn, repeat, memory):
+    """(best seconds, peak traced bytes or None)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak
+
+
+def compare(results, baseline, tolerance):
+    """Benchmarks that regressed against the baseline"""
+    previous = {(r["bench"], r["scale"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["bench"], r["scale"]))
+        if old is None:
+            continue
+        if r["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append(f"{r['bench']} {r['scale']}x: {old['seconds']:.3f}s -> {r['seconds']:.3f}s")
+        if r.get("peak_mb") and old.get("peak_mb") and r["peak_mb"] > old["peak_mb"] * (1 + tolerance):
+            regressions.append(f"{r['bench']} {r['scale']}x: {old['peak_mb']:.1f} MB -> {r['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default="1,10,100")
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    parser.add_argument("--rows", type=int, default=500, help="rows per synthesized payload")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--formats", help="override OUTPUT_FORMATS, e.g. xlsx,parquet")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of stub POSTs that 503")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --save to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.formats:
+        mhf.OUTPUT_FORMATS = [f.strip() for f in args.formats.split(",") if f.strip()]
+    mhf.check_output_formats(mhf.OUTPUT_FORMATS)
+
+    stub = start_stub(recordings_dir=args.recordings, rows=args.rows, fail_rate=args.fail_rate)
+    point_fetcher_at(stub.url)
+    mhf.rate_limiter = mhf.TokenBucket(rate=1e6, burst=len(mhf.QUERIES))  # measure the pipeline, not politeness
+    mhf.github_sha = None
+
+    workdir = tempfile.mkdtemp(prefix="mhf-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    source = "recordings" if any(os.path.exists(os.path.join(args.recordings, mhf.query_slug(n) + ".json"))
+                                 for n in mhf.QUERIES) else f"synthesized {args.rows}-row payloads"
+    print(f"🧪 Stub {stub.url} - {source}, outputs: {','.join(mhf.OUTPUT_FORMATS)}")
+    print(f"{'bench':<8} {'scale':>6} {'rows':>9} {'MB in':>8} {'seconds':>9} {'rows/s':>11} {'MB/s':>8} {'peak MB':>9}")
+
+    results = []
+    try:
+        for scale in [int(s) for s in args.scales.split(",")]:
+            stub.scale = scale
+            bodies = {name: stub.body_for(info["query"]) for name, info in mhf.QUERIES.items()}
+            mb_in = sum(map(len, bodies.values())) / 1e6
+            frames = parse_all(bodies)
+            sheets = make_sheets(frames)
+            rows = sum(len(s) for s in sheets.values())
+
+            benches = [
+                ("parse", lambda: parse_all(bodies)),
+                ("write", lambda: write_outputs(frames, sheets)),
+                ("cycle", run_cycle),
+            ]
+            for bench, fn in benches:
+                seconds, peak = measure(fn, args.repeat, not args.no_memory)
+                result = {
+                    "bench": bench,
+                    "scale": scale,
+                    "rows": rows,
+                    "mb_in": round(mb_in, 3),
+                    "seconds": round(seconds, 4),
+                    "rows_per_s": round(rows / seconds, 1),
+                    "mb_per_s": round(mb_in / seconds, 3),
+                    "peak_mb": round(peak / 1e6, 2) if peak is not None else None,
+                }
+                results.append(result)
+                peak_col = f"{result['peak_mb']:>9.1f}" if peak is not None else f"{'-':>9}"
+                print(f"{bench:<8} {scale:>5}x {rows:>9} {mb_in:>8.2f} {seconds:>9.3f} "
+                      f"{result['rows_per_s']:>11.0f} {result['mb_per_s']:>8.2f} {peak_col}")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+        stub.shutdown()
+
+    print(f"🔑 Stub saw {stub.stats['posts']} POSTs, {stub.stats['warmups']} warm-ups, "
+          f"{stub.stats['failures']} injected failures, {stub.stats['bytes_in'] / 1e6:.1f} MB received")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Saved {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) over {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"✅ No regressions over {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Peak memory per query: resp.json() + parse_widget_data vs parse_widget_stream
+
+Usage:
+    python benchmarks/bench_stream.py [payload.json | recordings_dir ...] [--rows N]
+
+Each argument is a recorded widget/process response, or a directory of them
+(one query per file). Without arguments a "Stock List"-shaped payload is
+synthesized.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import market_health_fetcher as mhf
+from bench_parse import synth_payload
+
+
+def decode_full(path):
+    """What fetch_from_chartink does today: whole body, whole tree, then rows"""
+    with open(path, "rb") as f:
+        body = f.read()
+    return mhf.parse_widget_data(json.loads(body))
+
+
+def decode_stream(path):
+    with open(path, "rb") as f:
+        return mhf.parse_widget_stream(f)
+
+
+def measure(fn, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = fn(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, peak, elapsed
+
+
+def expand(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    if mhf.ijson is None:
+        print("❌ ijson is not installed - streaming decode unavailable")
+        return
+
+    tmp = None
+    files = expand(args.paths)
+    if not files:
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        json.dump(synth_payload(args.rows), tmp)
+        tmp.close()
+        files = [tmp.name]
+
+    try:
+        print(f"{'query':<32} {'rows':>6} {'full MB':>9} {'stream MB':>10} {'full s':>8} {'stream s':>9}")
+        for path in files:
+            full_df, full_peak, full_t = measure(decode_full, path)
+            stream_df, stream_peak, stream_t = measure(decode_stream, path)
+            if full_df is not None and not full_df.empty:
+                pd.testing.assert_frame_equal(full_df, stream_df)
+
+            name = os.path.splitext(os.path.basename(path))[0][:32]
+            rows = 0 if full_df is None else len(full_df)
+            print(f"{name:<32} {rows:>6} {full_peak / 1e6:>9.2f} {stream_peak / 1e6:>10.2f} "
+                  f"{full_t:>8.3f} {stream_t:>9.3f}")
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    main()
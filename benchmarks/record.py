@@ -0,0 +1,43 @@
+"""
+Record live widget/process responses for every entry in QUERIES
+
+Usage:
+    python benchmarks/record.py [--out benchmarks/recordings]
+
+Writes one <query_slug>.json per query, byte-for-byte as Chartink sent it.
+The stub server and the benchmarks replay these instead of hitting Chartink.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_health_fetcher as mhf
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--out", default=RECORDINGS_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for i, (query_name, query_info) in enumerate(mhf.QUERIES.items(), 1):
+        print(f"📊 [{i}/{len(mhf.QUERIES)}] {query_name}")
+        try:
+            resp = mhf.chartink.post({"query": query_info["query"]})
+            path = os.path.join(args.out, mhf.query_slug(query_name) + ".json")
+            with open(path, "wb") as f:
+                f.write(resp.content)
+            df = mhf.parse_widget_data(resp.json())
+            rows = 0 if df is None else len(df)
+            print(f"   ✅ {rows} rows, {len(resp.content) / 1e3:.1f} KB -> {path}")
+        except Exception as e:
+            print(f"   ❌ {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Local stub for the Chartink and GitHub endpoints the worker talks to
+
+Usage:
+    python benchmarks/stub_server.py [--port 8765] [--recordings DIR] [--scale N] [--fail-rate P]
+
+Then run the worker against it:
+    CHARTINK_URL=http://127.0.0.1:8765 GITHUB_API=http://127.0.0.1:8765 \\
+        python market_health_fetcher.py
+
+widget/process answers with the recorded response for the posted query
+(see record.py), or a synthesized one when there is no recording. Each
+response is repeated `scale` times. --fail-rate makes that share of POSTs
+return 503 so the retry path gets exercised too.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_health_fetcher as mhf
+from bench_parse import synth_payload
+from record import RECORDINGS_DIR
+
+CSRF_TOKEN = "stub-csrf-token"
+SCREENER_HTML = f'<html><head><meta name="csrf-token" content="{CSRF_TOKEN}"></head></html>'.encode()
+
+
+def scale_payload(data, scale):
+    """Repeat groupData `scale` times with unique symbol names"""
+    if scale == 1 or "groupData" not in data:
+        return data
+    groups = []
+    for i in range(scale):
+        for group in data["groupData"]:
+            groups.append(dict(group, name=f"{group.get('name', '')}_{i}" if i else group.get("name", "")))
+    return dict(data, groupData=groups)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, recordings_dir=RECORDINGS_DIR, rows=500, scale=1, fail_rate=0.0):
+        super().__init__(address, StubHandler)
+        self.recordings_dir = recordings_dir
+        self.rows = rows
+        self.scale = scale
+        self.fail_rate = fail_rate
+        self.lock = threading.Lock()
+        self.bodies = {}  # (slug, scale) -> encoded response
+        self.slugs = {info["query"]: mhf.query_slug(name) for name, info in mhf.QUERIES.items()}
+        self.stats = {"posts": 0, "warmups": 0, "failures": 0, "bytes_out": 0, "bytes_in": 0}
+        self.github_files = {}
+        self.script = []  # /script responses, popped in order: {"status", "headers", "delay"}
+        self.script_hits = 0
+
+    def handle_error(self, request, client_address):
+        """Clients hanging up mid-response (timeout tests) are expected"""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def recorded(self, slug):
+        path = os.path.join(self.recordings_dir or "", slug + ".json")
+        if self.recordings_dir and os.path.exists(path):
+            with open(path, "rb") as f:
+                return json.loads(f.read())
+        return synth_payload(self.rows)
+
+    def body_for(self, query):
+        slug = self.slugs.get(query, "unknown")
+        key = (slug, self.scale)
+        with self.lock:
+            if key not in self.bodies:
+                self.bodies[key] = json.dumps(scale_payload(self.recorded(slug), self.scale)).encode()
+            return self.bodies[key]
+
+    def count(self, stat, value=1):
+        with self.lock:
+            self.stats[stat] += value
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count("bytes_out", len(body))
+
+    def _json(self, status, obj):
+        self._send(status, json.dumps(obj).encode())
+
+    def _body(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count("bytes_in", len(body))
+        return body
+
+    def _scripted(self):
+        """Next queued response for /script - 200 once the queue is empty"""
+        with self.server.lock:
+            self.server.script_hits += 1
+            step = self.server.script.pop(0) if self.server.script else {}
+        time.sleep(step.get("delay", 0))
+        self._send(step.get("status", 200), b'{"ok": true}', headers=step.get("headers"))
+
+    # Chartink + GitHub reads
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/script":
+            self._scripted()
+        elif path == "/":
+            self._send(200, b"ok", "text/html")
+        elif path == "/screener":
+            self.server.count("warmups")
+            self._send(200, SCREENER_HTML, "text/html")
+        elif "/contents/" in path:
+            sha = self.server.github_files.get(path)
+            if sha is None:
+                self._json(404, {"message": "Not Found"})
+            else:
+                self._json(200, {"sha": sha})
+        elif "/git/ref/heads/" in path:
+            self._json(200, {"object": {"sha": "stub-commit"}})
+        elif "/git/commits/" in path:
+            self._json(200, {"tree": {"sha": "stub-tree"}})
+        else:
+            self._json(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if path == "/script":
+            self._scripted()
+        elif path == "/widget/process":
+            self.server.count("posts")
+            if self.headers.get("X-CSRF-TOKEN") != CSRF_TOKEN:
+                self._json(419, {"message": "CSRF token mismatch"})
+                return
+            if random.random() < self.server.fail_rate:
+                self.server.count("failures")
+                self._send(503, b"{}", headers={"Retry-After": "0"})
+                return
+            query = parse_qs(body.decode()).get("query", [""])[0]
+            self._send(200, self.server.body_for(query))
+        elif path.endswith(("/git/blobs", "/git/trees", "/git/commits")):
+            self._json(201, {"sha": hashlib.sha1(body).hexdigest()})
+        else:
+            self._json(404, {"message": "Not Found"})
+
+    def do_PUT(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if "/contents/" not in path:
+            self._json(404, {"message": "Not Found"})
+            return
+        sha = hashlib.sha1(body).hexdigest()
+        created = path not in self.server.github_files
+        self.server.github_files[path] = sha
+        self._json(201 if created else 200, {"content": {"sha": sha}})
+
+    def do_PATCH(self):
+        self._body()
+        self._json(200, {"object": {"sha": "stub-commit"}})
+
+
+def start_stub(port=0, **kwargs):
+    """Start the stub on a daemon thread"""
+    server = StubServer(("127.0.0.1", port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def point_fetcher_at(url):
+    """Send an already-imported worker's Chartink and GitHub calls to `url`"""
+    mhf.CI_HOME = url
+    mhf.CI_SCREENER = f"{url}/screener"
+    mhf.CI_WIDGET_PROCESS = f"{url}/widget/process"
+    mhf.GITHUB_API = url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    parser.add_argument("--rows", type=int, default=500, help="rows per synthesized payload")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubServer(("127.0.0.1", args.port), recordings_dir=args.recordings, rows=args.rows,
+                        scale=args.scale, fail_rate=args.fail_rate)
+    print(f"🧪 Stub Chartink + GitHub on {server.url} (scale {args.scale}x)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n🛑 Stopped - {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,155 +4,1080 @@ Perfect for Railway + PythonAnywhere combo!
 """
 
 import json
+import random
+import re
+import sqlite3
 import time
 import requests
 from bs4 import BeautifulSoup as bs
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from datetime import time as dtime
 import os
 import base64
+import hashlib
+from email.utils import parsedate_to_datetime
+import threading
+import importlib.util
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 
+try:
+    import ijson
+except ImportError:  # streaming decode is optional
+    ijson = None
+
+try:
+    import xlsxwriter  # noqa: F401 - much faster than openpyxl for write-only workbooks
+    XLSX_ENGINE = 'xlsxwriter'
+except ImportError:
+    XLSX_ENGINE = 'openpyxl'
+
 IST = pytz.timezone("Asia/Kolkata")
 EXCEL_FILE = "market_health_data.xlsx"
 UPDATE_INTERVAL = 120  # 2 minutes
 
+# Market calendar - NSE cash segment
+MARKET_OPEN = dtime(9, 15)
+MARKET_CLOSE = dtime(15, 30)
+POST_CLOSE_SNAPSHOT = os.environ.get('POST_CLOSE_SNAPSHOT', '1') == '1'
+POST_CLOSE_DELAY = int(os.environ.get('POST_CLOSE_DELAY', 300))  # seconds after close
+POST_CLOSE_WINDOW = int(os.environ.get('POST_CLOSE_WINDOW', 1800))  # skip it if we wake later than this
+WAKE_SLACK = 5  # seconds a wake-up may run late and still count as its scheduled boundary
+
+# NSE trading holidays (weekdays only) - check against the NSE circular each
+# year; extra dates can be added with NSE_HOLIDAYS=YYYY-MM-DD,YYYY-MM-DD
+NSE_HOLIDAYS = {
+    # 2025
+    "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14",
+    "2025-04-18", "2025-05-01", "2025-08-15", "2025-08-27", "2025-10-02",
+    "2025-10-21", "2025-10-22", "2025-11-05", "2025-12-25",
+    # 2026
+    "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31", "2026-04-03",
+    "2026-04-14", "2026-05-01", "2026-05-28", "2026-06-26", "2026-09-14",
+    "2026-10-02", "2026-10-20", "2026-11-10", "2026-11-24", "2026-12-25",
+}
+NSE_HOLIDAYS |= {d.strip() for d in os.environ.get('NSE_HOLIDAYS', '').split(',') if d.strip()}
+
+# Output - xlsx for humans, per-query files + JSON manifest for dashboards
+# Formats: xlsx, parquet, feather, csv.gz (parquet/feather need pyarrow)
+OUTPUT_FORMATS = [f.strip() for f in os.environ.get('OUTPUT_FORMATS', 'xlsx').split(',') if f.strip()]
+OUTPUT_DIR = os.environ.get('OUTPUT_DIR', 'market_health_data')
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, 'manifest.json')
+GITHUB_ARTIFACTS_PATH = os.environ.get('GITHUB_ARTIFACTS_PATH', 'market_health_data')  # folder in the repo
+
+# Intraday history - every fetched snapshot, opt-in (e.g. HISTORY_DB=market_history.db)
+HISTORY_DB = os.environ.get('HISTORY_DB', '')
+HISTORY_DAYS = int(os.environ.get('HISTORY_DAYS', 30))  # rows older than this are pruned, 0 keeps all
+HISTORY_BATCH = int(os.environ.get('HISTORY_BATCH', 50000))  # rows buffered before a forced flush
+
 # GitHub Config - Set these in Railway Environment Variables
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN', 'your-token-here')
 GITHUB_REPO = os.environ.get('GITHUB_REPO', 'your-username/market-health-data')
 GITHUB_BRANCH = os.environ.get('GITHUB_BRANCH', 'main')
+GITHUB_API = os.environ.get('GITHUB_API', 'https://api.github.com')
+GITHUB_ARTIFACTS = os.environ.get('GITHUB_ARTIFACTS', '0') == '1'  # also commit per-query files
+
+# HTTP layer - shared by Chartink and GitHub calls
+HTTP_TIMEOUT = (float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5)),
+                float(os.environ.get('HTTP_READ_TIMEOUT', 30)))  # (connect, read) seconds
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 3))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', 1.0))  # base seconds, doubled per attempt
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', 30))  # also caps Retry-After
+RETRY_STATUS = (429, 500, 502, 503, 504)
+BREAKER_THRESHOLD = int(os.environ.get('BREAKER_THRESHOLD', 5))  # failed attempts in a row, retries included
+BREAKER_COOLDOWN = int(os.environ.get('BREAKER_COOLDOWN', 300))  # seconds before a probe
+
+# Metrics - Prometheus text on METRICS_PORT (0 = off), JSON line per cycle to METRICS_LOG
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+METRICS_LOG = os.environ.get('METRICS_LOG', '')
 
 # Chartink URLs
-CI_HOME = "https://chartink.com"
+CI_HOME = os.environ.get('CHARTINK_URL', 'https://chartink.com')  # override to replay against a stub
 CI_SCREENER = f"{CI_HOME}/screener"
 CI_WIDGET_PROCESS = f"{CI_HOME}/widget/process"
 
+# Chartink session - CSRF token is reused until it ages out or gets rejected
+CSRF_MAX_AGE = int(os.environ.get('CSRF_MAX_AGE', 1800))  # seconds
+CSRF_REJECT_CODES = (401, 403, 419)
+
+# Concurrent fetch - keep Chartink traffic polite with a token bucket
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', 4))
+RATE_LIMIT = float(os.environ.get('RATE_LIMIT', 1.0))  # requests per second, 0 = no limit
+RATE_BURST = int(os.environ.get('RATE_BURST', 2))
+
+# Stream-decode groupData instead of resp.json() - needs ijson
+STREAM_JSON = os.environ.get('STREAM_JSON', '0') == '1' and ijson is not None
+
+# Refresh classes - seconds a parsed result stays fresh before it is refetched
+REFRESH_TTL = {
+    "live": 0,               # every cycle
+    "slow": 30 * 60,         # barely moves intraday
+    "quarterly": 24 * 3600,  # shareholding data
+}
+CACHE_GRACE = int(os.environ.get('CACHE_GRACE', 900))  # keep stale results this long as a fallback
+
 # YOUR QUERIES
 QUERIES = {
     "Top Gainers": {
         "query": "select latest Close - 1 day ago Close / 1 day ago Close * 100 as 'DAILY', latest Close - 1 week ago Close / 1 week ago Close * 100 as 'WEEKLY', latest Close - 1 month ago Close / 1 month ago Close * 100 as 'MONTHLY' WHERE( {cash} ( latest close > 1 day ago close and market cap > 1000 ) ) GROUP BY symbol ORDER BY 1 desc",
-        "icon": "🚀"
+        "icon": "🚀",
+        "refresh": "live"
     },
     "Top Losers": {
         "query": "select ( ( latest Close - 1 day ago Close ) / 1 day ago Close ) * 100 as 'DAILY', ( ( latest Close - 1 week ago Close ) / 1 week ago Close ) * 100 as 'WEEKLY', ( ( latest Close - 1 month ago Close ) / 1 month ago Close ) * 100 as 'MONTHLY' WHERE( {cash} ( latest close < 1 day ago close and market cap > 1000 ) ) GROUP BY symbol ORDER BY 1 asc",
-        "icon": "📉"
+        "icon": "📉",
+        "refresh": "live"
     },
     "1 Month Performance": {
         "query": "select ( ( latest Close - 30 days ago Close ) / 30 days ago Close ) * 100 as '% change' WHERE( {cash} ( latest close > 20 and market cap > 500 ) ) GROUP BY symbol ORDER BY 1 desc",
-        "icon": "📈"
+        "icon": "📈",
+        "refresh": "live"
     },
     "distance from Dma50": {
         "query": "select latest Close - latest Sma( latest Close , 50 ) / latest Sma( latest Close , 50 ) * 100 as 'Distance from SMA50' WHERE {45603} 1 = 1 GROUP BY symbol ORDER BY 1 desc",
-        "icon": "📈"
+        "icon": "📈",
+        "refresh": "live"
     },
     "Retail Shareholding Increase": {
         "query": "select 3 quarter ago {custom_indicator_68140_start}\"total percentage - (  total foreign promoter and group percentage +  indian promoter and group percentage +  {custom_indicator_52652_start}\"foreign institution other percentage +  foreign direct investments institutions percentage +  foreign institutional investors percentage +  foreign bank percentage +  foreign collaborators percentage +  foreign venture capital investors percentage +  foreign non institution other percentage\"{custom_indicator_52652_end} +  {custom_indicator_52657_start}\"mutual funds or uti percentage +  insurance companies percentage +  others institutions percentage +  clearing members percentage +  corporate bodies percentage +  govt central or state percentage +  trusts institutes percentage +  venture capital funds percentage +  nsdl intransit percentage +  financial institutions or banks percentage\"{custom_indicator_52657_end} +  others non promoter non institution percentage )\"{custom_indicator_68140_end} as '% 3 Qtrs ago', 2 quarter ago {custom_indicator_68140_start}\"total percentage - (  total foreign promoter and group percentage +  indian promoter and group percentage +  {custom_indicator_52652_start}\"foreign institution other percentage +  foreign direct investments institutions percentage +  foreign institutional investors percentage +  foreign bank percentage +  foreign collaborators percentage +  foreign venture capital investors percentage +  foreign non institution other percentage\"{custom_indicator_52652_end} +  {custom_indicator_52657_start}\"mutual funds or uti percentage +  insurance companies percentage +  others institutions percentage +  clearing members percentage +  corporate bodies percentage +  govt central or state percentage +  trusts institutes percentage +  venture capital funds percentage +  nsdl intransit percentage +  financial institutions or banks percentage\"{custom_indicator_52657_end} +  others non promoter non institution percentage )\"{custom_indicator_68140_end} as '% 2 Qtr ago', 1 quarter ago {custom_indicator_68140_start}\"total percentage - (  total foreign promoter and group percentage +  indian promoter and group percentage +  {custom_indicator_52652_start}\"foreign institution other percentage +  foreign direct investments institutions percentage +  foreign institutional investors percentage +  foreign bank percentage +  foreign collaborators percentage +  foreign venture capital investors percentage +  foreign non institution other percentage\"{custom_indicator_52652_end} +  {custom_indicator_52657_start}\"mutual funds or uti percentage +  insurance companies percentage +  others institutions percentage +  clearing members percentage +  corporate bodies percentage +  govt central or state percentage +  trusts institutes percentage +  venture capital funds percentage +  nsdl intransit percentage +  financial institutions or banks percentage\"{custom_indicator_52657_end} +  others non promoter non institution percentage )\"{custom_indicator_68140_end} as '% 1 Qtr ago', Quarterly {custom_indicator_68140_start}\"total percentage - (  total foreign promoter and group percentage +  indian promoter and group percentage +  {custom_indicator_52652_start}\"foreign institution other percentage +  foreign direct investments institutions percentage +  foreign institutional investors percentage +  foreign bank percentage +  foreign collaborators percentage +  foreign venture capital investors percentage +  foreign non institution other percentage\"{custom_indicator_52652_end} +  {custom_indicator_52657_start}\"mutual funds or uti percentage +  insurance companies percentage +  others institutions percentage +  clearing members percentage +  corporate bodies percentage +  govt central or state percentage +  trusts institutes percentage +  venture capital funds percentage +  nsdl intransit percentage +  financial institutions or banks percentage\"{custom_indicator_52657_end} +  others non promoter non institution percentage )\"{custom_indicator_68140_end} as '% Current Qtr', Quarterly {custom_indicator_68140_start}\"total percentage - (  total foreign promoter and group percentage +  indian promoter and group percentage +  {custom_indicator_52652_start}\"foreign institution other percentage +  foreign direct investments institutions percentage +  foreign institutional investors percentage +  foreign bank percentage +  foreign collaborators percentage +  foreign venture capital investors percentage +  foreign non institution other percentage\"{custom_indicator_52652_end} +  {custom_indicator_52657_start}\"mutual funds or uti percentage +  insurance companies percentage +  others institutions percentage +  clearing members percentage +  corporate bodies percentage +  govt central or state percentage +  trusts institutes percentage +  venture capital funds percentage +  nsdl intransit percentage +  financial institutions or banks percentage\"{custom_indicator_52657_end} +  others non promoter non institution percentage )\"{custom_indicator_68140_end} - 3 quarter ago {custom_indicator_68140_start}\"total percentage - (  total foreign promoter and group percentage +  indian promoter and group percentage +  {custom_indicator_52652_start}\"foreign institution other percentage +  foreign direct investments institutions percentage +  foreign institutional investors percentage +  foreign bank percentage +  foreign collaborators percentage +  foreign venture capital investors percentage +  foreign non institution other percentage\"{custom_indicator_52652_end} +  {custom_indicator_52657_start}\"mutual funds or uti percentage +  insurance companies percentage +  others institutions percentage +  clearing members percentage +  corporate bodies percentage +  govt central or state percentage +  trusts institutes percentage +  venture capital funds percentage +  nsdl intransit percentage +  financial institutions or banks percentage\"{custom_indicator_52657_end} +  others non promoter non institution percentage )\"{custom_indicator_68140_end} as 'Change in 3 Qtrs' WHERE {cash} 1 = 1 GROUP BY symbol ORDER BY 5 desc",
-        "icon": "👥"
+        "icon": "👥",
+        "refresh": "quarterly"
     },
 
     "Industry Analysis": {
         "query": "select latest \"close - 1 candle ago close / 1 candle ago close * 100\" as 'Daily', Weekly \"close - 1 candle ago close / 1 candle ago close * 100\" as 'Weekly', Monthly \"close - 1 candle ago close / 1 candle ago close * 100\" as 'Monthly', Yearly \"close - 1 candle ago close / 1 candle ago close * 100\" as '1 year', 1 year ago \"close - 1 candle ago close / 1 candle ago close * 100\" as '2 years', 2 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" as '3 years', 4 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" as '5 years', 1 year ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 2 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 3 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 4 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 5 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" / 5 as 'CAGR(5Y)', 1 year ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 2 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 3 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 4 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 5 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 6 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 7 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 8 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 9 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" + 10 years ago \"close - 1 candle ago close / 1 candle ago close * 100\" / 10 as 'CAGR(10Y)' WHERE( {cash} ( market cap > 500 ) ) GROUP BY industry ORDER BY 2 desc",
-        "icon": "🏭"
+        "icon": "🏭",
+        "refresh": "slow"
     },
 
     "Stock List": {
         "query": "select Symbol as 'STOCK NAME', latest Close as 'PRICE', ( ( latest Close - 1 day ago Close ) / 1 day ago Close ) * 100 as '% CHANGE', 52 weeks ago High as '52w High', ( ( 52 weeks ago High - latest Close ) / 52 weeks ago High ) * 100 as 'Distance 52w High', Market Cap as 'Market Cap' WHERE {cash} 1 = 1 GROUP BY symbol ORDER BY 1 desc",
-        "icon": "📋"
+        "icon": "📋",
+        "refresh": "live"
     },
 
     "1 Year Return": {
         "query": "select ( ( latest Close - 1 year ago Close ) / 1 year ago Close ) * 100 as '% change' WHERE( {cash} ( latest close > 20 and market cap > 500 ) ) GROUP BY symbol ORDER BY 1 desc",
-        "icon": "📅"
+        "icon": "📅",
+        "refresh": "slow"
     },
 
     "Promoters Increasing": {
         "query": "select Quarterly {custom_indicator_74292_start}\"indian promoter and group percentage + total foreign promoter and group percentage\"{custom_indicator_74292_end} as '% Current Qtr', Quarterly {custom_indicator_74292_start}\"indian promoter and group percentage + total foreign promoter and group percentage\"{custom_indicator_74292_end} - 3 quarter ago {custom_indicator_74292_start}\"indian promoter and group percentage + total foreign promoter and group percentage\"{custom_indicator_74292_end} as 'Change in 3 Qtrs', 3 quarter ago {custom_indicator_74292_start}\"indian promoter and group percentage + total foreign promoter and group percentage\"{custom_indicator_74292_end} as '% 3 Qtr ago', 2 quarter ago {custom_indicator_74292_start}\"indian promoter and group percentage + total foreign promoter and group percentage\"{custom_indicator_74292_end} as '% 2 Qtr ago', 1 quarter ago {custom_indicator_74292_start}\"indian promoter and group percentage + total foreign promoter and group percentage\"{custom_indicator_74292_end} as '% 1 Qtr ago' WHERE {cash} 1 = 1 GROUP BY symbol ORDER BY 2 desc",
-        "icon": "👔"
+        "icon": "👔",
+        "refresh": "quarterly"
     },
 
     "2 Week Return": {
         "query": "select ( ( latest Close - 14 days ago Close ) / 14 days ago Close ) * 100 as '% change' WHERE( {cash} ( latest close > 20 and market cap > 500 ) ) GROUP BY symbol ORDER BY 1 desc",
-        "icon": "📆"
+        "icon": "📆",
+        "refresh": "live"
     },
 
     "FII Increasing Stake": {
         "query": "select 3 quarter ago {custom_indicator_52652_start}\"foreign institution other percentage + foreign direct investments institutions percentage + foreign institutional investors percentage + foreign bank percentage + foreign collaborators percentage + foreign venture capital investors percentage + foreign non institution other percentage\"{custom_indicator_52652_end} as '% 3 Qtr ago', 2 quarter ago {custom_indicator_52652_start}\"foreign institution other percentage + foreign direct investments institutions percentage + foreign institutional investors percentage + foreign bank percentage + foreign collaborators percentage + foreign venture capital investors percentage + foreign non institution other percentage\"{custom_indicator_52652_end} as '% 2 Qtr ago', 1 quarter ago {custom_indicator_52652_start}\"foreign institution other percentage + foreign direct investments institutions percentage + foreign institutional investors percentage + foreign bank percentage + foreign collaborators percentage + foreign venture capital investors percentage + foreign non institution other percentage\"{custom_indicator_52652_end} as '% 1 Qtr ago', Quarterly {custom_indicator_52652_start}\"foreign institution other percentage + foreign direct investments institutions percentage + foreign institutional investors percentage + foreign bank percentage + foreign collaborators percentage + foreign venture capital investors percentage + foreign non institution other percentage\"{custom_indicator_52652_end} as '% Current Qtr', Quarterly {custom_indicator_52652_start}\"foreign institution other percentage + foreign direct investments institutions percentage + foreign institutional investors percentage + foreign bank percentage + foreign collaborators percentage + foreign venture capital investors percentage + foreign non institution other percentage\"{custom_indicator_52652_end} - 3 quarter ago {custom_indicator_52652_start}\"foreign institution other percentage + foreign direct investments institutions percentage + foreign institutional investors percentage + foreign bank percentage + foreign collaborators percentage + foreign venture capital investors percentage + foreign non institution other percentage\"{custom_indicator_52652_end} as 'Change in 3 Qtr' WHERE {cash} 1 = 1 GROUP BY symbol ORDER BY 5 desc",
-        "icon": "🌍"
+        "icon": "🌍",
+        "refresh": "quarterly"
     },
 }
 
 
-def fetch_from_chartink(payload, timeout=15):
-    """Fetch from Chartink"""
-    with requests.Session() as s:
+class Metrics:
+    """Per-phase timing spans, counters and gauges for the worker
+
+    Spans accumulate into Prometheus-style sum/count series and into the
+    current cycle's record, which is appended to METRICS_LOG as one JSON
+    line when the cycle ends.
+    """
+
+    def __init__(self, log_path=METRICS_LOG):
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.durations = {}  # (phase, labels) -> [sum, count, last]
+        self.counters = {}   # (name, labels) -> value
+        self.gauges = {}     # (name, labels) -> value
+        self.cycle = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @contextmanager
+    def span(self, phase, **labels):
+        """Time a block - `with metrics.span("post", query=name): ...`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                entry = self.durations.setdefault(self._key(phase, labels), [0.0, 0, 0.0])
+                entry[0] += elapsed
+                entry[1] += 1
+                entry[2] = elapsed
+                if self.cycle is not None:
+                    self.cycle["spans"].append(dict(labels, phase=phase, seconds=round(elapsed, 4)))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+            if self.cycle is not None:
+                self.cycle["counters"][key] = self.cycle["counters"].get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        with self.lock:
+            key = self._key(name, labels)
+            self.gauges[key] = value
+            if self.cycle is not None:
+                self.cycle["gauges"][key] = value
+
+    def start_cycle(self):
+        with self.lock:
+            self.cycle = {"started": datetime.now(IST).isoformat(), "spans": [], "counters": {}, "gauges": {}}
+
+    def end_cycle(self):
+        """Close the cycle record and append it to METRICS_LOG"""
+        with self.lock:
+            cycle, self.cycle = self.cycle, None
+        if cycle is None:
+            return None
+        for kind in ("counters", "gauges"):
+            cycle[kind] = [dict(labels, name=name, value=value)
+                           for (name, labels), value in cycle[kind].items()]
+        if not self.log_path:
+            return cycle
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(cycle, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️  Metrics log error: {e}")
+        return cycle
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            durations = dict(self.durations)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        lines = [
+            "# TYPE mhf_phase_seconds summary",
+        ]
+        for (phase, labels), (total, count, _) in sorted(durations.items()):
+            lbl = self._labels((("phase", phase),) + labels)
+            lines.append(f"mhf_phase_seconds_sum{lbl} {total:.6f}")
+            lines.append(f"mhf_phase_seconds_count{lbl} {count}")
+        lines.append("# TYPE mhf_phase_last_seconds gauge")
+        for (phase, labels), (_, _, last) in sorted(durations.items()):
+            lines.append(f"mhf_phase_last_seconds{self._labels((('phase', phase),) + labels)} {last:.6f}")
+        for name in sorted({n for n, _ in counters}):
+            lines.append(f"# TYPE mhf_{name} counter")
+            lines.extend(f"mhf_{name}{self._labels(labels)} {value}"
+                         for (n, labels), value in sorted(counters.items()) if n == name)
+        for name in sorted({n for n, _ in gauges}):
+            lines.append(f"# TYPE mhf_{name} gauge")
+            lines.extend(f"mhf_{name}{self._labels(labels)} {value}"
+                         for (n, labels), value in sorted(gauges.items()) if n == name)
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # keep scrapes out of the worker log
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics from a daemon thread"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class CircuitOpenError(RuntimeError):
+    """Endpoint is failing - calls are skipped until the cooldown passes"""
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: open after N failed attempts, one probe per cooldown"""
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.half_open = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.cooldown:
+                # Half-open: this caller is the one probe, everyone else
+                # waits out another cooldown (so does a probe that never reports)
+                self.opened_at = time.time()
+                self.half_open = True
+                return True
+            return False
+
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.half_open = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.half_open or (self.failures >= self.threshold and self.opened_at is None):
+                self.opened_at = time.time()
+                self.half_open = False
+                metrics.inc("circuit_opened_total", endpoint=self.name)
+                print(f"🔌 {self.name} circuit OPEN - skipping for {self.cooldown}s")
+
+
+breakers = {}
+
+
+def get_breaker(endpoint):
+    if endpoint not in breakers:
+        breakers[endpoint] = CircuitBreaker(endpoint)
+    return breakers[endpoint]
+
+
+def new_http_session(pool_size=10):
+    """Pooled requests.Session"""
+    s = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1))
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def _retry_after(resp):
+    """Seconds from a Retry-After header (delta or HTTP date), or None"""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(pytz.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def http_request(session, method, url, endpoint, retries=HTTP_RETRIES, before_attempt=None, **kwargs):
+    """Request with timeouts, jittered exponential retries and a circuit breaker
+
+    429/5xx and connection errors are retried, honouring Retry-After. Every
+    failed attempt counts towards the breaker, and retries stop as soon as
+    it opens. The last response is returned as-is once retries run out, so
+    callers still decide what a status code means. `before_attempt` runs before every
+    attempt, retries included - e.g. to take a rate-limit token.
+    """
+    breaker = get_breaker(endpoint)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{endpoint} circuit open - skipping")
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+
+    for attempt in range(retries + 1):
+        resp, error = None, None
+        if before_attempt is not None:
+            before_attempt()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        else:
+            if resp.status_code not in RETRY_STATUS:
+                breaker.record_success()
+                return resp
+
+        metrics.inc("http_failures_total", endpoint=endpoint,
+                    status=resp.status_code if resp is not None else type(error).__name__)
+        breaker.record_failure()
+        if attempt == retries or breaker.is_open():
+            break  # out of retries, or this (or a concurrent) call tripped the breaker
+        delay = _retry_after(resp)
+        if delay is None:
+            delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF * 2 ** attempt))
+        elif delay > HTTP_BACKOFF_MAX:
+            break  # server wants us gone for longer than a cycle can wait
+        if resp is not None:
+            resp.close()
+        time.sleep(delay)
+
+    if resp is not None:
+        return resp
+    raise error
+
+
+class ChartinkSession:
+    """One pooled Chartink session with a cached CSRF token for the whole run"""
+
+    def __init__(self, max_token_age=CSRF_MAX_AGE):
+        self.max_token_age = max_token_age
+        self.session = None
+        self.csrf = None
+        self.referer = CI_SCREENER
+        self.token_time = 0.0
+        self.warmups = 0
+        self.posts = 0
+        self.lock = threading.Lock()
+
+    def _new_session(self):
+        s = new_http_session(FETCH_WORKERS)
         s.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
         })
+        return s
+
+    def token_expired(self):
+        return self.csrf is None or (time.time() - self.token_time) > self.max_token_age
 
-        warm = s.get(CI_HOME, timeout=timeout)
-        scr = s.get(CI_SCREENER, timeout=timeout)
-        scr.raise_for_status()
+    def warm_up(self, timeout=HTTP_TIMEOUT):
+        """Scrape a fresh CSRF token from the screener page"""
+        if self.session is None:
+            self.session = self._new_session()
 
-        soup = bs(scr.content, "lxml")
-        meta = soup.find("meta", {"name": "csrf-token"})
-        if not meta or not meta.get("content"):
-            raise RuntimeError("CSRF token not found")
-        csrf = meta["content"]
+        with metrics.span("csrf_warmup"):
+            http_request(self.session, "GET", CI_HOME, "chartink", timeout=timeout)
+            scr = http_request(self.session, "GET", CI_SCREENER, "chartink", timeout=timeout)
+            scr.raise_for_status()
 
+            soup = bs(scr.content, "lxml")
+            meta = soup.find("meta", {"name": "csrf-token"})
+            if not meta or not meta.get("content"):
+                raise RuntimeError("CSRF token not found")
+
+        self.csrf = meta["content"]
+        self.referer = scr.url
+        self.token_time = time.time()
+        self.warmups += 1
+
+    def _post(self, payload, csrf, timeout, stream=False):
         headers = {
             "X-CSRF-TOKEN": csrf,
             "X-Requested-With": "XMLHttpRequest",
             "Accept": "application/json",
             "Origin": CI_HOME,
-            "Referer": scr.url,
+            "Referer": self.referer,
             "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
         }
-        
-        resp = s.post(CI_WIDGET_PROCESS, data=payload, headers=headers, timeout=timeout)
+        return http_request(self.session, "POST", CI_WIDGET_PROCESS, "chartink",
+                            before_attempt=self._before_post,
+                            data=payload, headers=headers, timeout=timeout, stream=stream)
+
+    def _before_post(self):
+        """Every POST attempt, retries included, takes a token and is counted"""
+        rate_limiter.acquire()
+        with self.lock:
+            self.posts += 1
+
+    def post(self, payload, timeout=HTTP_TIMEOUT, stream=False):
+        """POST a widget query, re-warming once if the token is stale or rejected"""
+        with self.lock:
+            if self.token_expired():
+                self.warm_up(timeout)
+            csrf = self.csrf
+
+        resp = self._post(payload, csrf, timeout, stream)
+        if resp.status_code in CSRF_REJECT_CODES:
+            resp.close()
+            with self.lock:
+                # Another worker may already have refreshed the token
+                if self.csrf == csrf:
+                    self.warm_up(timeout)
+                csrf = self.csrf
+            resp = self._post(payload, csrf, timeout, stream)
+
         resp.raise_for_status()
+        return resp
+
+    def stats(self):
+        return {"warmups": self.warmups, "posts": self.posts}
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self.csrf = None
+
+
+chartink = ChartinkSession()
+
+
+def fetch_from_chartink(payload, timeout=HTTP_TIMEOUT, query_name=""):
+    """Fetch from Chartink"""
+    with metrics.span("post", query=query_name):
+        resp = chartink.post(payload, timeout=timeout)
+    # Bytes on the wire (before gzip is undone) - same measure as the stream path
+    metrics.inc("payload_bytes_total", resp.raw.tell(), query=query_name)
+    with metrics.span("decode", query=query_name):
         return resp.json()
 
 
-def parse_widget_data(data):
-    """Parse Chartink response"""
-    if "groupData" not in data:
-        return None
-    
+def fetch_widget_frame(payload, query_name, timeout=HTTP_TIMEOUT):
+    """Fetch from Chartink and parse groupData straight off the response stream"""
+    with metrics.span("post", query=query_name):
+        resp = chartink.post(payload, timeout=timeout, stream=True)
+    with resp, metrics.span("decode_parse", query=query_name):
+        resp.raw.decode_content = True  # let urllib3 undo gzip/deflate
+        df = parse_widget_stream(resp.raw)
+        metrics.inc("payload_bytes_total", resp.raw.tell(), query=query_name)  # wire bytes
+        return df
+
+
+class TokenBucket:
+    """Thread-safe token bucket - blocks until a request slot is free
+
+    A non-positive rate disables the limit.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+rate_limiter = TokenBucket()
+
+
+def fetch_query(query_name, query_info):
+    """Fetch and parse one query - returns (df, error)"""
+    try:
+        payload = {"query": query_info["query"]}
+        if STREAM_JSON:
+            df = fetch_widget_frame(payload, query_name)
+        else:
+            data = fetch_from_chartink(payload, query_name=query_name)
+            with metrics.span("parse", query=query_name):
+                df = parse_widget_data(data)
+        metrics.gauge("rows", 0 if df is None else len(df), query=query_name)
+        return df, None
+    except Exception as e:
+        metrics.inc("errors_total", query=query_name, error=type(e).__name__)
+        return None, e
+
+
+def fetch_all_queries(queries, workers=FETCH_WORKERS):
+    """Fetch queries concurrently, results in the same order as `queries`"""
+    items = list(queries.items())
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = [pool.submit(fetch_query, name, info) for name, info in items]
+        return [(name, info) + f.result() for (name, info), f in zip(items, futures)]
+
+
+class QueryCache:
+    """Last successful parse per query (empty results included), evicted by age"""
+
+    def __init__(self, grace=CACHE_GRACE):
+        self.grace = grace
+        self.entries = {}  # query name -> (df, fetched_at)
+
+    def ttl(self, query_info):
+        return REFRESH_TTL[query_info.get("refresh", "live")]
+
+    def is_due(self, query_name, query_info):
+        entry = self.entries.get(query_name)
+        return entry is None or (time.time() - entry[1]) >= self.ttl(query_info)
+
+    def get(self, query_name):
+        entry = self.entries.get(query_name)
+        return entry[0] if entry else None
+
+    def put(self, query_name, df):
+        self.entries[query_name] = (df, time.time())
+
+    def evict(self, queries):
+        """Drop results older than their TTL plus the grace period"""
+        now = time.time()
+        for name, (df, fetched_at) in list(self.entries.items()):
+            info = queries.get(name)
+            if info is None or now - fetched_at > self.ttl(info) + self.grace:
+                del self.entries[name]
+
+
+query_cache = QueryCache()
+
+
+def refresh_queries(queries):
+    """Fetch only the queries that are due, reuse cached results for the rest
+
+    Returns (name, info, df, error, cached) tuples in `queries` order.
+    """
+    query_cache.evict(queries)
+    due = {name: info for name, info in queries.items() if query_cache.is_due(name, info)}
+    fetched = {name: (df, error) for name, _, df, error in fetch_all_queries(due)}
+
+    results = []
+    for name, info in queries.items():
+        if name in fetched:
+            df, error = fetched[name]
+            if error is None:
+                # An empty result is a real answer ("No data"), not a failure
+                query_cache.put(name, df)
+                results.append((name, info, df, None, False))
+                continue
+            # Fetch failed - fall back to the last good result while it is within grace
+            cached = query_cache.get(name)
+            if cached is not None:
+                results.append((name, info, cached, error, True))
+            else:
+                results.append((name, info, df, error, False))
+        else:
+            results.append((name, info, query_cache.get(name), None, True))
+    return results
+
+
+NA_SENTINEL = 1.7e+308  # Chartink's "no value" marker
+
+
+def _parse_widget_rows(groups):
+    """Row-by-row parse - handles groups whose result keys differ"""
     rows = []
-    for group in data["groupData"]:
+    for group in groups:
         stock_name = group.get("name", "")
         results = group.get("results", [])
         
         row = {"Stock": stock_name}
         for result_dict in results:
             for key, values in result_dict.items():
-                if isinstance(values, list) and values:
-                    clean_val = values[-1] if values[-1] != 1.7e+308 else "N/A"
-                    row[key.title()] = clean_val
-                else:
-                    row[key.title()] = values
+                row[key.title()] = _last_or_na(values)
         rows.append(row)
     
     return pd.DataFrame(rows)
 
 
-def is_market_open():
+def _last_or_na(values):
+    if isinstance(values, list) and values:
+        return values[-1] if values[-1] != NA_SENTINEL else "N/A"
+    return values
+
+
+def _parse_widget_columns(groups):
+    """Columnar parse - column names once per payload, sentinel masked per column
+
+    Returns None when the groups don't share one key layout.
+    """
+    layout = [list(r) for r in groups[0].get("results", [])]
+    titles = [key.title() for keys in layout for key in keys]
+    if "Stock" in titles or len(set(titles)) != len(titles):
+        return None
+
+    results = [group.get("results", []) for group in groups]
+    if set(map(len, results)) != {len(layout)}:
+        return None
+
+    raw_columns = []
+    for i, keys in enumerate(layout):
+        dicts = [res[i] for res in results]
+        if set(map(len, dicts)) != {len(keys)}:
+            return None
+        try:
+            # One C-level pass per key - no per-row tuples or dicts
+            raw_columns.extend(list(map(itemgetter(key), dicts)) for key in keys)
+        except KeyError:
+            return None
+
+    columns = {"Stock": [group.get("name", "") for group in groups]}
+    for title, col in zip(titles, raw_columns):
+        if set(map(type, col)) == {list}:
+            try:
+                last = pd.Series([values[-1] for values in col])
+            except IndexError:  # an empty list somewhere
+                columns[title] = [_last_or_na(values) for values in col]
+                continue
+            if last.dtype.kind == "f" or last.dtype == object:  # str columns can't hold the sentinel
+                mask = last.to_numpy() == NA_SENTINEL
+                if mask.any():
+                    # Re-infer like the row path does - all-N/A or str + N/A columns become str
+                    last = last.where(~mask, "N/A").infer_objects()
+            columns[title] = last
+        else:
+            columns[title] = [_last_or_na(values) for values in col]
+
+    return pd.DataFrame(columns)
+
+
+def parse_widget_data(data):
+    """Parse Chartink response"""
+    if "groupData" not in data:
+        return None
+    
+    groups = data["groupData"]
+    if not groups:
+        return pd.DataFrame()
+
+    df = _parse_widget_columns(groups)
+    if df is None:
+        df = _parse_widget_rows(groups)
+    return df
+
+
+def parse_widget_stream(fp):
+    """Parse a Chartink response from a file-like object, one group at a time
+
+    Each group is reduced to its last values as soon as it is decoded, so
+    neither the raw body nor the full object tree is held in memory.
+    Matches parse_widget_data, except that a response without groups
+    gives None.
+    """
+    columns = {"Stock": []}
+    n_rows = 0
+
+    for group in ijson.items(fp, "groupData.item", use_float=True):
+        row = {"Stock": group.get("name", "")}
+        for result_dict in group.get("results", []):
+            for key, values in result_dict.items():
+                row[key.title()] = _last_or_na(values)
+
+        for title, val in row.items():
+            if title not in columns:
+                columns[title] = [float("nan")] * n_rows
+            columns[title].append(val)
+        n_rows += 1
+        if len(row) != len(columns):
+            for col in columns.values():
+                if len(col) < n_rows:
+                    col.append(float("nan"))
+
+    if not n_rows:
+        return None
+    return pd.DataFrame(columns)
+
+
+def is_trading_day(day):
+    """Weekday that isn't an NSE holiday"""
+    return day.weekday() < 5 and day.isoformat() not in NSE_HOLIDAYS
+
+
+def session_bounds(day):
+    """(open, close) datetimes of the session on `day`"""
+    return (IST.localize(datetime.combine(day, MARKET_OPEN)),
+            IST.localize(datetime.combine(day, MARKET_CLOSE)))
+
+
+def is_market_open(now=None):
     """Check if Indian stock market is open"""
-    now = datetime.now(IST)
+    now = now or datetime.now(IST)
     
-    # Check if weekend (Saturday=5, Sunday=6)
-    if now.weekday() >= 5:
+    # Weekends and NSE holidays
+    if not is_trading_day(now.date()):
         return False
     
     # Market hours: 9:15 AM - 3:30 PM IST
-    market_start = now.replace(hour=9, minute=15, second=0, microsecond=0)
-    market_end = now.replace(hour=15, minute=30, second=0, microsecond=0)
-    
+    market_start, market_end = session_bounds(now.date())
     return market_start <= now <= market_end
 
 
+def next_market_open(now=None):
+    """Start of the next session - today's if it hasn't opened yet"""
+    now = now or datetime.now(IST)
+    day = now.date()
+    if not is_trading_day(day) or now >= session_bounds(day)[0]:
+        day += timedelta(days=1)
+        while not is_trading_day(day):
+            day += timedelta(days=1)
+    return session_bounds(day)[0]
+
+
+def next_cycle_time(now=None, interval=UPDATE_INTERVAL):
+    """Next session boundary after now - open + k*interval, capped at the close
+
+    Boundaries are anchored to the open, so for 120s the cycles run at
+    09:15, 09:17, ... 15:29 and a last one at the 15:30 close. Aligning to
+    the clock instead of sleeping a fixed interval after each cycle keeps
+    slow cycles from pushing later snapshots out of step.
+    """
+    now = now or datetime.now(IST)
+    market_open, market_close = session_bounds(now.date())
+    elapsed = (now - market_open).total_seconds()
+    wake = market_open + timedelta(seconds=(int(elapsed // interval) + 1) * interval)
+    return min(wake, market_close) if now < market_close else wake
+
+
+def on_schedule(now, wake, slack=WAKE_SLACK):
+    """`wake` when now is just past it, else now
+
+    sleep_until returns a little after the boundary it slept towards; a
+    15:30:00.002 wake-up must still run the 15:30 close cycle.
+    """
+    if wake is not None and timedelta(0) <= now - wake <= timedelta(seconds=slack):
+        return wake
+    return now
+
+
+def next_action(now, last_post_close=None):
+    """What the main loop does at `now` - (action, wake)
+
+    "cycle" while the market is open, "post_close" for the one snapshot
+    POST_CLOSE_DELAY after the close, "wait" until that snapshot is due,
+    or "closed" until the next open. `wake` is set for the last two.
+    """
+    market_close = session_bounds(now.date())[1]
+    post_close_at = market_close + timedelta(seconds=POST_CLOSE_DELAY)
+    post_close_until = post_close_at + timedelta(seconds=POST_CLOSE_WINDOW)
+
+    if is_market_open(now):
+        return "cycle", None
+    if (POST_CLOSE_SNAPSHOT and is_trading_day(now.date())
+            and market_close < now < post_close_until and last_post_close != now.date()):
+        # One final snapshot once the closing prices have settled
+        if now < post_close_at:
+            return "wait", post_close_at
+        return "post_close", None
+    return "closed", next_market_open(now)
+
+
+def check_holiday_calendar(today=None):
+    """Warn when NSE_HOLIDAYS has nothing for this year or next"""
+    today = today or datetime.now(IST).date()
+    missing = [str(year) for year in (today.year, today.year + 1)
+               if not any(d.startswith(f"{year}-") for d in NSE_HOLIDAYS)]
+    if missing:
+        print(f"⚠️  No NSE holidays listed for {', '.join(missing)} - holidays will be treated as "
+              f"trading days. Update NSE_HOLIDAYS or set the NSE_HOLIDAYS env var.")
+    return missing
+
+
+def sleep_until(wake):
+    """Sleep until `wake`, in chunks so clock jumps don't oversleep"""
+    while True:
+        remaining = (wake - datetime.now(IST)).total_seconds()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, 3600))
+
+
+def query_slug(query_name):
+    """File-name-safe version of a query name"""
+    return re.sub(r'[^a-z0-9]+', '_', query_name.lower()).strip('_')
+
+
+def _columnar_frame(df):
+    """Parquet/Arrow need one type per column - N/A becomes a missing value"""
+    out = df.copy()
+    for col in out.columns:
+        if out[col].dtype == object:
+            values = out[col].where(out[col] != "N/A")
+            numeric = pd.to_numeric(values, errors='coerce')
+            if numeric.notna().sum() == values.notna().sum():
+                out[col] = numeric
+            else:
+                out[col] = out[col].astype(str)
+    return out
+
+
+def _write_parquet(df, path):
+    _columnar_frame(df).to_parquet(path, index=False)
+
+
+def _write_feather(df, path):
+    _columnar_frame(df).to_feather(path)
+
+
+def _write_csv_gz(df, path):
+    df.to_csv(path, index=False, compression='gzip')
+
+
+# format -> (file extension, writer)
+OUTPUT_WRITERS = {
+    "parquet": (".parquet", _write_parquet),
+    "feather": (".feather", _write_feather),
+    "csv.gz": (".csv.gz", _write_csv_gz),
+}
+
+# Python modules each output format needs
+OUTPUT_BACKENDS = {
+    "xlsx": [XLSX_ENGINE],
+    "parquet": ["pyarrow"],
+    "feather": ["pyarrow"],
+    "csv.gz": [],
+}
+
+
+def check_output_formats(formats):
+    """Fail loudly on unknown formats or missing backends instead of mid-cycle"""
+    unknown = [f for f in formats if f not in OUTPUT_BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown OUTPUT_FORMATS {unknown} - choose from {sorted(OUTPUT_BACKENDS)}")
+    if not formats:
+        raise ValueError("OUTPUT_FORMATS is empty")
+    missing = sorted({m for f in formats for m in OUTPUT_BACKENDS[f] if importlib.util.find_spec(m) is None})
+    if missing:
+        raise ImportError(f"OUTPUT_FORMATS {formats} need {missing} - pip install {' '.join(missing)}")
+
+
+# Sheet hashes already written to OUTPUT_DIR - unchanged queries aren't rewritten
+artifact_hashes = {}
+
+
+def _atomic_write(path, write):
+    """Write to a temp file and rename, so readers never see a half-written file"""
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_workbook(sheets, now):
+    """Write the human-facing xlsx - Metadata sheet plus one sheet per query"""
+    with pd.ExcelWriter(EXCEL_FILE, engine=XLSX_ENGINE) as writer:
+        metadata_df = pd.DataFrame({
+            'Last Updated': [now.strftime('%d %b %Y, %I:%M %p')],
+            'Total Queries': [len(QUERIES)],
+        })
+        metadata_df.to_excel(writer, sheet_name='Metadata', index=False)
+        for query_name, sheet in sheets.items():
+            sheet.to_excel(writer, sheet_name=query_name[:31], index=False)
+
+
+def write_artifacts(results, sheets, hashes, now):
+    """Write per-query files for every non-xlsx format plus the JSON manifest
+
+    Returns {query name: [file paths]} for every query that has data.
+    """
+    formats = [f for f in OUTPUT_FORMATS if f in OUTPUT_WRITERS]
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    files = {}
+    manifest = {
+        "last_updated": now.isoformat(),
+        "total_queries": len(QUERIES),
+        "queries": {},
+    }
+    for query_name, query_info, df, error, cached in results:
+        entry = {
+            "icon": query_info["icon"],
+            "refresh": query_info.get("refresh", "live"),
+            "rows": 0,
+            "cached": cached,
+            "files": {},
+        }
+        if error is not None:
+            entry["error"] = str(error)
+
+        sheet = sheets.get(query_name)
+        if sheet is not None:
+            paths = {fmt: os.path.join(OUTPUT_DIR, query_slug(query_name) + OUTPUT_WRITERS[fmt][0])
+                     for fmt in formats}
+            unchanged = (artifact_hashes.get(query_name) == hashes[query_name]
+                         and all(os.path.exists(path) for path in paths.values()))
+            if not unchanged:
+                for fmt, path in paths.items():
+                    _atomic_write(path, lambda tmp, fmt=fmt: OUTPUT_WRITERS[fmt][1](sheet, tmp))
+                artifact_hashes[query_name] = hashes[query_name]
+
+            files[query_name] = list(paths.values())
+            entry.update({
+                "rows": len(sheet),
+                "columns": list(map(str, sheet.columns)),
+                "hash": hashes[query_name],
+                "files": {fmt: os.path.relpath(path, OUTPUT_DIR) for fmt, path in paths.items()},
+            })
+        manifest["queries"][query_name] = entry
+
+    def dump_manifest(tmp):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    _atomic_write(MANIFEST_FILE, dump_manifest)
+    return files
+
+
+def sheet_hash(df):
+    """Stable content hash of one sheet's data"""
+    h = hashlib.sha1()
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    # Object columns can hold unhashable cells like [] - hash their text instead
+    objects = df.columns[df.dtypes == object]
+    if len(objects):
+        df = df.astype({col: str for col in objects})
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+
+# Upload state for this run - remote blob SHA from the last PUT, and the
+# sheet hashes that went into it
+github_sha = None
+uploaded_hashes = None
+
+
+github_session = new_http_session()
+github_session.headers.update({
+    "Authorization": f"token {GITHUB_TOKEN}",
+    "Accept": "application/vnd.github.v3+json"
+})
+
+
+def github_request(method, url, **kwargs):
+    """GitHub API call through the shared pooled session"""
+    return http_request(github_session, method, url, "github", **kwargs)
+
+
+def _get_github_sha(url):
+    try:
+        resp = github_request("GET", url, params={"ref": GITHUB_BRANCH})
+        if resp.status_code == 200:
+            return resp.json()['sha']
+    except Exception:
+        pass
+    return None
+
+
 def upload_to_github():
     """Upload Excel to GitHub - EASY METHOD!"""
+    global github_sha
     try:
         print("📤 Uploading to GitHub...")
         
@@ -161,21 +1086,11 @@ def upload_to_github():
             content = base64.b64encode(f.read()).decode('utf-8')
         
         # GitHub API URL
-        url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{EXCEL_FILE}"
+        url = f"{GITHUB_API}/repos/{GITHUB_REPO}/contents/{EXCEL_FILE}"
         
-        headers = {
-            "Authorization": f"token {GITHUB_TOKEN}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        
-        # Check if file exists (to get SHA)
-        sha = None
-        try:
-            resp = requests.get(url, headers=headers)
-            if resp.status_code == 200:
-                sha = resp.json()['sha']
-        except:
-            pass
+        # Only ask GitHub for the SHA when we don't have one from the last PUT
+        if github_sha is None:
+            github_sha = _get_github_sha(url)
         
         # Prepare data
         data = {
@@ -184,18 +1099,30 @@ def upload_to_github():
             "branch": GITHUB_BRANCH
         }
         
-        if sha:
-            data["sha"] = sha  # Update existing file
+        if github_sha:
+            data["sha"] = github_sha  # Update existing file
         
         # Upload
-        response = requests.put(url, json=data, headers=headers)
+        response = github_request("PUT", url, json=data)
+        
+        # Cached SHA is stale (file changed behind our back) - refetch once
+        if response.status_code in [409, 422] and github_sha:
+            print("   ♻️  Remote SHA changed, retrying")
+            github_sha = _get_github_sha(url)
+            if github_sha:
+                data["sha"] = github_sha
+            else:
+                data.pop("sha", None)
+            response = github_request("PUT", url, json=data)
         
         if response.status_code in [200, 201]:
+            github_sha = response.json().get('content', {}).get('sha')
             download_url = f"https://raw.githubusercontent.com/{GITHUB_REPO}/{GITHUB_BRANCH}/{EXCEL_FILE}"
             print(f"✅ Uploaded to GitHub!")
             print(f"🔗 Download URL: {download_url}")
             return download_url
         else:
+            github_sha = None
             print(f"❌ Upload failed: {response.status_code}")
             print(f"   {response.text}")
             return None
@@ -205,95 +1132,334 @@ def upload_to_github():
         return None
 
 
+def _to_epoch(value):
+    """datetime / date string / epoch seconds -> epoch seconds (naive = IST)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(IST)
+    return ts.timestamp()
+
+
+class HistoryStore:
+    """Append-only SQLite store of every fetched screener snapshot
+
+    One row per (query, fetch timestamp, symbol); the remaining columns are
+    kept as a JSON object since every query has its own columns.
+    """
+
+    def __init__(self, path=HISTORY_DB, batch=HISTORY_BATCH, keep_days=HISTORY_DAYS):
+        self.path = path
+        self.batch = batch
+        self.keep_days = keep_days
+        self.pruned_on = None
+        self.pending = []
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # dashboards can read while we write
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                query  TEXT NOT NULL,
+                ts     REAL NOT NULL,
+                symbol TEXT NOT NULL,
+                data   TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_history_query_ts ON history (query, ts, symbol);
+            CREATE INDEX IF NOT EXISTS idx_history_symbol ON history (symbol, query, ts);
+        """)
+
+    def record(self, query_name, df, fetched_at):
+        """Buffer one parsed DataFrame - written on the next flush()"""
+        values = df.drop(columns=[c for c in ("Stock", "Icon") if c in df.columns])
+        values = values.astype(object).where(values.notna(), None)
+        data = [json.dumps(r, ensure_ascii=False) for r in values.to_dict('records')]
+        self.pending.extend(zip([query_name] * len(df), [fetched_at] * len(df),
+                                df["Stock"].astype(str), data))
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows in one transaction"""
+        if not self.pending:
+            return 0
+        with self.conn:
+            self.conn.executemany("INSERT INTO history VALUES (?, ?, ?, ?)", self.pending)
+        written = len(self.pending)
+        self.pending = []
+        self.prune()
+        return written
+
+    def prune(self):
+        """Drop rows older than keep_days - at most once a day"""
+        today = datetime.now(IST).date()
+        if not self.keep_days or self.pruned_on == today:
+            return 0
+        cutoff = time.time() - self.keep_days * 86400
+        with self.conn:
+            deleted = self.conn.execute("DELETE FROM history WHERE ts < ?", (cutoff,)).rowcount
+        self.pruned_on = today
+        if deleted:
+            print(f"🗄️  Pruned {deleted} history rows older than {self.keep_days} days")
+        return deleted
+
+    def _time_range(self, sql, params, start, end):
+        if start is not None:
+            sql += " AND ts >= ?"
+            params.append(_to_epoch(start))
+        if end is not None:
+            sql += " AND ts <= ?"
+            params.append(_to_epoch(end))
+        return sql, params
+
+    def _frame(self, rows):
+        df = pd.DataFrame([json.loads(data) for *_, data in rows])
+        df.insert(0, "Stock", [r[2] for r in rows])
+        df.insert(0, "Query", [r[0] for r in rows])
+        df.insert(0, "Timestamp", pd.to_datetime([r[1] for r in rows], unit="s", utc=True).tz_convert(IST))
+        return df
+
+    def snapshots(self, query_name, start=None, end=None):
+        """All rows of one query between start and end (inclusive)"""
+        sql = "SELECT query, ts, symbol, data FROM history WHERE query = ?"
+        params = [query_name]
+        sql, params = self._time_range(sql, params, start, end)
+        return self._frame(self.conn.execute(sql + " ORDER BY ts, rowid", params).fetchall())
+
+    def symbol_history(self, symbol, query_name=None, start=None, end=None):
+        """One symbol across snapshots, optionally limited to one query"""
+        sql = "SELECT query, ts, symbol, data FROM history WHERE symbol = ?"
+        params = [symbol]
+        if query_name is not None:
+            sql += " AND query = ?"
+            params.append(query_name)
+        sql, params = self._time_range(sql, params, start, end)
+        return self._frame(self.conn.execute(sql + " ORDER BY query, ts", params).fetchall())
+
+    def timestamps(self, query_name, start=None, end=None):
+        """Fetch timestamps recorded for a query"""
+        sql = "SELECT DISTINCT ts FROM history WHERE query = ?"
+        params = [query_name]
+        sql, params = self._time_range(sql, params, start, end)
+        rows = self.conn.execute(sql + " ORDER BY ts", params).fetchall()
+        return [datetime.fromtimestamp(r[0], IST) for r in rows]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+history = None  # opened in main()
+
+
+def repo_path(path):
+    """Repo-relative git tree path for a file under OUTPUT_DIR"""
+    rel = os.path.relpath(path, OUTPUT_DIR).replace(os.sep, '/')
+    return "/".join(p for p in (GITHUB_ARTIFACTS_PATH.strip('/'), rel) if p)
+
+
+def upload_artifacts_to_github(paths):
+    """Commit several files in one go through the Git Data API"""
+    try:
+        print(f"📤 Committing {len(paths)} artifacts to GitHub...")
+        
+        api = f"{GITHUB_API}/repos/{GITHUB_REPO}"
+        
+        ref = github_request("GET", f"{api}/git/ref/heads/{GITHUB_BRANCH}")
+        ref.raise_for_status()
+        parent = ref.json()["object"]["sha"]
+        
+        commit = github_request("GET", f"{api}/git/commits/{parent}")
+        commit.raise_for_status()
+        base_tree = commit.json()["tree"]["sha"]
+        
+        tree = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                content = base64.b64encode(f.read()).decode('utf-8')
+            blob = github_request("POST", f"{api}/git/blobs",
+                                  json={"content": content, "encoding": "base64"})
+            blob.raise_for_status()
+            tree.append({
+                "path": repo_path(path),
+                "mode": "100644",
+                "type": "blob",
+                "sha": blob.json()["sha"],
+            })
+        
+        new_tree = github_request("POST", f"{api}/git/trees",
+                                  json={"base_tree": base_tree, "tree": tree})
+        new_tree.raise_for_status()
+        
+        new_commit = github_request("POST", f"{api}/git/commits", json={
+            "message": f"Update artifacts: {datetime.now(IST).strftime('%Y-%m-%d %H:%M')}",
+            "tree": new_tree.json()["sha"],
+            "parents": [parent],
+        })
+        new_commit.raise_for_status()
+        
+        update = github_request("PATCH", f"{api}/git/refs/heads/{GITHUB_BRANCH}",
+                                json={"sha": new_commit.json()["sha"]})
+        update.raise_for_status()
+        
+        print(f"✅ Committed {len(paths)} artifacts")
+        return True
+        
+    except Exception as e:
+        print(f"❌ GitHub artifact commit error: {e}")
+        return False
+
+
 def update_excel_file():
-    """Fetch and save to Excel"""
+    """Fetch and save to Excel / per-query artifacts"""
     print(f"\n{'='*70}")
     print(f"🔄 {datetime.now(IST).strftime('%d %b %Y, %I:%M %p')}")
     print(f"{'='*70}")
     
+    metrics.start_cycle()
+    try:
+        with metrics.span("cycle"):
+            return _run_cycle()
+    finally:
+        stats = chartink.stats()
+        metrics.gauge("chartink_warmups", stats["warmups"])
+        metrics.gauge("chartink_posts", stats["posts"])
+        for endpoint, breaker in list(breakers.items()):
+            metrics.gauge("circuit_open", int(breaker.opened_at is not None), endpoint=endpoint)
+        metrics.end_cycle()
+
+
+def _run_cycle():
+    global uploaded_hashes
     success_count = 0
+    sheets = {}
+    hashes = {}
     
     try:
-        with pd.ExcelWriter(EXCEL_FILE, engine='openpyxl') as writer:
-            
-            # Metadata
-            metadata_df = pd.DataFrame({
-                'Last Updated': [datetime.now(IST).strftime('%d %b %Y, %I:%M %p')],
-                'Total Queries': [len(QUERIES)],
-            })
-            metadata_df.to_excel(writer, sheet_name='Metadata', index=False)
-            print("✅ Metadata")
+        # Fetch queries that are due, reuse cached sheets for the rest
+        start = time.time()
+        with metrics.span("fetch_all"):
+            results = refresh_queries(QUERIES)
+        fetched = sum(1 for r in results if not r[4])
+        print(f"⚡ Fetched {fetched}/{len(results)} queries in {time.time() - start:.1f}s ({FETCH_WORKERS} workers)")
+
+        for i, (query_name, query_info, df, error, cached) in enumerate(results, 1):
+            print(f"\n📊 [{i}/{len(QUERIES)}] {query_name}")
             
-            # Fetch queries
-            for i, (query_name, query_info) in enumerate(QUERIES.items(), 1):
-                print(f"\n📊 [{i}/{len(QUERIES)}] {query_name}")
-                
-                try:
-                    payload = {"query": query_info["query"]}
-                    data = fetch_from_chartink(payload)
-                    df = parse_widget_data(data)
-                    
-                    if df is not None and not df.empty:
-                        df.insert(0, 'Icon', query_info['icon'])
-                        df.to_excel(writer, sheet_name=query_name[:31], index=False)
-                        print(f"   ✅ {len(df)} rows")
-                        success_count += 1
-                    else:
-                        print(f"   ⚠️  No data")
-                        
-                except Exception as e:
-                    print(f"   ❌ {e}")
-                
-                time.sleep(2)
+            if error is not None:
+                print(f"   ❌ {error}")
+            if df is not None and not df.empty:
+                if history is not None and not cached:
+                    history.record(query_name, df, query_cache.entries[query_name][1])
+                sheet = df.copy()
+                sheet.insert(0, 'Icon', query_info['icon'])
+                sheets[query_name] = sheet
+                hashes[query_name] = sheet_hash(df)
+                print(f"   {'♻️  cached,' if cached else '✅'} {len(df)} rows")
+                success_count += 1
+            elif error is None:
+                print(f"   ⚠️  No data")
         
-        print(f"\n✅ Excel saved!")
+        now = datetime.now(IST)
+        if "xlsx" in OUTPUT_FORMATS:
+            start = time.time()
+            with metrics.span("excel_write"):
+                write_workbook(sheets, now)
+            print(f"\n✅ Excel saved! ({XLSX_ENGINE}, {time.time() - start:.1f}s)")
         
-        # Upload to GitHub
+        artifacts = {}
+        if any(f in OUTPUT_WRITERS for f in OUTPUT_FORMATS):
+            start = time.time()
+            with metrics.span("artifacts_write"):
+                artifacts = write_artifacts(results, sheets, hashes, now)
+            print(f"✅ Artifacts + manifest saved to {OUTPUT_DIR}/ ({time.time() - start:.1f}s)")
+        
+        if history is not None:
+            with metrics.span("history_flush"):
+                written = history.flush()
+            if written:
+                print(f"🗄️  {written} history rows saved to {HISTORY_DB}")
+        
+        stats = chartink.stats()
+        print(f"🔑 Chartink session: {stats['warmups']} warm-ups / {stats['posts']} POSTs")
+        
+        # Upload to GitHub - only when some sheet's data actually changed
         if success_count > 0:
-            upload_to_github()
+            if hashes == uploaded_hashes:
+                print("⏭️  No sheet changed since last upload - skipping GitHub")
+            else:
+                ok = True
+                if "xlsx" in OUTPUT_FORMATS:
+                    with metrics.span("upload"):
+                        ok = upload_to_github() is not None
+                if GITHUB_ARTIFACTS and artifacts:
+                    previous = uploaded_hashes or {}
+                    changed = [path for name, paths in artifacts.items()
+                               if previous.get(name) != hashes[name] for path in paths]
+                    with metrics.span("upload_artifacts"):
+                        ok = upload_artifacts_to_github(changed + [MANIFEST_FILE]) and ok
+                if ok:
+                    uploaded_hashes = hashes
+                else:
+                    metrics.inc("upload_errors_total")
         
         return True
         
     except Exception as e:
+        metrics.inc("cycle_errors_total")
         print(f"❌ {e}")
         return False
 
 
 def main():
     """Main loop"""
+    global history
+    check_output_formats(OUTPUT_FORMATS)
     print("🚀 Market Health Fetcher - GitHub Edition")
     print(f"📊 Queries: {len(QUERIES)}")
     print(f"⏱️  Interval: {UPDATE_INTERVAL}s")
-    print(f"🕐 Market Hours: 9:15 AM - 3:30 PM IST (Mon-Fri)\n")
+    print(f"🕐 Market Hours: 9:15 AM - 3:30 PM IST (Mon-Fri, excl. NSE holidays)")
+    check_holiday_calendar()
+    print(f"💾 Outputs: {', '.join(OUTPUT_FORMATS)}")
+    if HISTORY_DB:
+        history = HistoryStore()
+        print(f"🗄️  History: {HISTORY_DB} (keeping {HISTORY_DAYS or 'all'} days)")
+    if METRICS_PORT:
+        start_metrics_server()
+        print(f"📈 Metrics: http://0.0.0.0:{METRICS_PORT}/metrics")
+    print()
     
+    last_post_close = None
+    wake = None
     while True:
         try:
+            now = on_schedule(datetime.now(IST), wake)
+            action, wake = next_action(now, last_post_close)
+            
             # Check if market is open
-            if is_market_open():
+            if action == "cycle":
                 print("✅ Market is OPEN - Fetching data...")
                 update_excel_file()
-                print(f"\n⏳ Next update in {UPDATE_INTERVAL}s...\n")
+                wake = next_cycle_time()
+                print(f"\n⏳ Next update at {wake.strftime('%I:%M:%S %p')}\n")
+            elif action == "wait":
+                print(f"📸 Post-close snapshot at {wake.strftime('%I:%M %p')}\n")
+            elif action == "post_close":
+                print("📸 Market CLOSED - Taking post-close snapshot...")
+                update_excel_file()
+                last_post_close = now.date()
+                continue
             else:
-                now = datetime.now(IST)
                 print(f"⏸️  Market CLOSED ({now.strftime('%I:%M %p')}) - Skipping update")
-                
-                # Calculate time until market opens
-                if now.weekday() >= 5:  # Weekend
-                    days_until_monday = 7 - now.weekday()
-                    next_open = now + pd.Timedelta(days=days_until_monday)
-                    next_open = next_open.replace(hour=9, minute=15, second=0)
-                    print(f"   Next market open: Monday at 9:15 AM")
-                elif now.hour < 9 or (now.hour == 9 and now.minute < 15):
-                    print(f"   Market opens today at 9:15 AM")
-                else:
-                    print(f"   Market opens tomorrow at 9:15 AM")
-                
-                print(f"   Checking again in {UPDATE_INTERVAL}s...\n")
+                print(f"   Next market open: {wake.strftime('%a %d %b at %I:%M %p')}")
+                print(f"   Sleeping {(wake - now).total_seconds() / 3600:.1f}h...\n")
             
-            time.sleep(UPDATE_INTERVAL)
+            sleep_until(wake)
             
         except KeyboardInterrupt:
             print("\n🛑 Stopped")
+            if history is not None:
+                history.close()
             break
         except Exception as e:
             print(f"❌ {e}")
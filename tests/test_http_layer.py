@@ -0,0 +1,220 @@
+"""
+http_request / CircuitBreaker against the local stub server
+
+Run with:
+    python -m pytest tests/    (or: python -m unittest discover tests)
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+from email.utils import formatdate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import requests
+
+import market_health_fetcher as mhf
+from stub_server import start_stub
+
+
+class HttpLayerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.stub = start_stub(recordings_dir=None, rows=10)
+        cls.url = f"{cls.stub.url}/script"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.shutdown()
+
+    def setUp(self):
+        self.saved = {name: getattr(mhf, name) for name in ("HTTP_BACKOFF", "HTTP_BACKOFF_MAX")}
+        mhf.HTTP_BACKOFF = 0.01
+        self.stub.script = []
+        self.stub.script_hits = 0
+        self.session = mhf.new_http_session()
+        self.endpoint = self.id()  # fresh breaker per test
+
+    def tearDown(self):
+        for name, value in self.saved.items():
+            setattr(mhf, name, value)
+        self.session.close()
+        mhf.breakers.pop(self.endpoint, None)
+
+    def script(self, *steps):
+        self.stub.script = list(steps)
+
+    def request(self, **kwargs):
+        return mhf.http_request(self.session, "GET", self.url, self.endpoint, **kwargs)
+
+    def test_503_and_429_are_retried_until_success(self):
+        self.script({"status": 503}, {"status": 429})
+        resp = self.request()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.stub.script_hits, 3)
+
+    def test_post_is_retried_too(self):
+        self.script({"status": 502})
+        resp = mhf.http_request(self.session, "POST", self.url, self.endpoint, data={"q": "x"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self.stub.script_hits, 2)
+
+    def test_before_attempt_runs_for_every_attempt(self):
+        calls = []
+        self.script({"status": 429}, {"status": 503})
+        self.request(before_attempt=lambda: calls.append(1))
+        self.assertEqual(len(calls), 3)
+
+    def test_numeric_retry_after_is_honoured(self):
+        self.script({"status": 429, "headers": {"Retry-After": "1"}})
+        start = time.monotonic()
+        resp = self.request()
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+    def test_http_date_retry_after_is_honoured(self):
+        when = formatdate(time.time() + 2, usegmt=True)
+        self.script({"status": 503, "headers": {"Retry-After": when}})
+        start = time.monotonic()
+        resp = self.request()
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+    def test_retry_after_above_backoff_max_stops_retrying(self):
+        mhf.HTTP_BACKOFF_MAX = 5
+        self.script({"status": 503, "headers": {"Retry-After": "120"}})
+        start = time.monotonic()
+        resp = self.request()
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(self.stub.script_hits, 1)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_exhausted_retries_return_last_response(self):
+        self.script(*[{"status": 500}] * 3)
+        resp = self.request(retries=2)
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(self.stub.script_hits, 3)
+
+    def test_read_timeout_is_raised(self):
+        self.script(*[{"delay": 1}] * 2)
+        with self.assertRaises(requests.ReadTimeout):
+            self.request(retries=1, timeout=(1, 0.2))
+        self.assertEqual(self.stub.script_hits, 2)
+
+    def test_connect_timeout_is_raised(self):
+        # A listener with a full backlog never completes the handshake
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(0)
+        port = server.getsockname()[1]
+        fillers = []
+        for _ in range(8):
+            sock = socket.socket()
+            sock.setblocking(False)
+            try:
+                sock.connect(("127.0.0.1", port))
+            except BlockingIOError:
+                pass
+            fillers.append(sock)
+        try:
+            with self.assertRaises(requests.ConnectTimeout):
+                mhf.http_request(self.session, "GET", f"http://127.0.0.1:{port}/", self.endpoint,
+                                 retries=0, timeout=(0.3, 1))
+        finally:
+            for sock in fillers:
+                sock.close()
+            server.close()
+
+    def breaker(self, threshold, cooldown):
+        mhf.breakers[self.endpoint] = mhf.CircuitBreaker(self.endpoint, threshold=threshold, cooldown=cooldown)
+        return mhf.breakers[self.endpoint]
+
+    def test_breaker_opens_after_threshold_failed_calls(self):
+        self.breaker(threshold=3, cooldown=60)
+        self.script(*[{"status": 500}] * 3)
+        for _ in range(3):
+            self.assertEqual(self.request(retries=0).status_code, 500)
+        with self.assertRaises(mhf.CircuitOpenError):
+            self.request(retries=0)
+        self.assertEqual(self.stub.script_hits, 3)
+
+    def test_breaker_counts_failed_attempts_and_stops_retrying(self):
+        self.breaker(threshold=3, cooldown=60)
+        self.script(*[{"status": 503}] * 6)
+        self.assertEqual(self.request(retries=5).status_code, 503)
+        self.assertEqual(self.stub.script_hits, 3)
+        with self.assertRaises(mhf.CircuitOpenError):
+            self.request()
+
+    def test_success_resets_failure_count(self):
+        breaker = self.breaker(threshold=2, cooldown=60)
+        self.script({"status": 500}, {"status": 200}, {"status": 500})
+        for _ in range(3):
+            self.request(retries=0)
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_probe_reopens_after_one_failure(self):
+        self.breaker(threshold=3, cooldown=0.2)
+        self.script(*[{"status": 500}] * 4)
+        for _ in range(3):
+            self.request(retries=0)
+        with self.assertRaises(mhf.CircuitOpenError):
+            self.request(retries=0)
+
+        time.sleep(0.25)
+        self.assertEqual(self.request(retries=0).status_code, 500)  # the probe
+        with self.assertRaises(mhf.CircuitOpenError):
+            self.request(retries=0)
+        self.assertEqual(self.stub.script_hits, 4)
+
+    def test_half_open_probe_gets_a_single_attempt(self):
+        self.breaker(threshold=2, cooldown=0.2)
+        self.script(*[{"status": 500}] * 6)
+        self.request(retries=1)
+        time.sleep(0.25)
+        self.assertEqual(self.request(retries=3).status_code, 500)
+        self.assertEqual(self.stub.script_hits, 3)
+
+    def test_half_open_lets_one_probe_through(self):
+        self.breaker(threshold=1, cooldown=0.2)
+        self.script({"status": 500}, {"delay": 0.3})
+        self.request(retries=0)
+        time.sleep(0.25)
+
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(self.request(retries=0).status_code)
+            except mhf.CircuitOpenError:
+                outcomes.append("open")
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(map(str, outcomes)), ["200", "open", "open", "open"])
+        self.assertEqual(self.stub.script_hits, 2)
+        self.assertFalse(mhf.breakers[self.endpoint].is_open())
+
+    def test_half_open_probe_success_closes_breaker(self):
+        breaker = self.breaker(threshold=2, cooldown=0.2)
+        self.script(*[{"status": 500}] * 2)
+        for _ in range(2):
+            self.request(retries=0)
+        time.sleep(0.25)
+        self.assertEqual(self.request(retries=0).status_code, 200)
+        self.assertEqual(breaker.failures, 0)
+        self.assertTrue(breaker.allow())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+parse_widget_data paths must agree: row-by-row, columnar and streamed
+
+Run with:
+    python -m pytest tests/    (or: python -m unittest discover tests)
+"""
+
+import io
+import json
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import pandas as pd
+
+import market_health_fetcher as mhf
+from bench_parse import synth_payload
+
+S = mhf.NA_SENTINEL
+
+# Small payloads whose columnar parse must match the row parse exactly
+EDGE_CASES = {
+    "all sentinel": [{"x": [S]}, {"x": [S]}],
+    "some sentinel": [{"x": [1.5]}, {"x": [S]}],
+    "string and sentinel": [{"x": ["a"]}, {"x": [S]}],
+    "all string and sentinel": [{"x": [S]}, {"x": ["a"]}, {"x": ["b"]}],
+    "ints": [{"x": [1]}, {"x": [2]}],
+    "int and sentinel": [{"x": [1]}, {"x": [S]}],
+    "empty list": [{"x": [1.0]}, {"x": []}],
+    "scalar": [{"x": 1.0}, {"x": "a"}],
+    "strings": [{"x": ["a"]}, {"x": ["b"]}],
+    "last value wins": [{"x": [S, 2.0]}, {"x": [1.0, S]}],
+}
+
+
+def groups_for(results):
+    return [{"name": f"S{i}", "results": [r]} for i, r in enumerate(results)]
+
+
+class ColumnarParseTest(unittest.TestCase):
+
+    def test_edge_cases_match_row_parse(self):
+        for case, results in EDGE_CASES.items():
+            with self.subTest(case):
+                groups = groups_for(results)
+                pd.testing.assert_frame_equal(mhf._parse_widget_rows(groups), mhf._parse_widget_columns(groups))
+
+    def test_sentinel_in_string_column_is_masked(self):
+        df = mhf._parse_widget_columns(groups_for([{"x": ["a"]}, {"x": [S]}]))
+        self.assertEqual(df["X"].tolist(), ["a", "N/A"])
+
+    def test_synthesized_payload_matches_row_parse(self):
+        groups = synth_payload(500)["groupData"]
+        cols = mhf._parse_widget_columns(groups)
+        self.assertIn("N/A", cols["52W High"].tolist())
+        pd.testing.assert_frame_equal(mhf._parse_widget_rows(groups), cols)
+
+    def test_irregular_layout_falls_back(self):
+        groups = [{"name": "A", "results": [{"x": [1.0]}]}, {"name": "B", "results": [{"y": [2.0]}]}]
+        self.assertIsNone(mhf._parse_widget_columns(groups))
+        self.assertEqual(list(mhf.parse_widget_data({"groupData": groups}).columns), ["Stock", "X", "Y"])
+
+    def test_no_groups(self):
+        self.assertIsNone(mhf.parse_widget_data({}))
+        self.assertTrue(mhf.parse_widget_data({"groupData": []}).empty)
+
+
+@unittest.skipIf(mhf.ijson is None, "ijson not installed")
+class StreamParseTest(unittest.TestCase):
+
+    def assert_stream_matches(self, data):
+        streamed = mhf.parse_widget_stream(io.BytesIO(json.dumps(data).encode()))
+        pd.testing.assert_frame_equal(mhf.parse_widget_data(data), streamed)
+
+    def test_synthesized_payload(self):
+        self.assert_stream_matches(synth_payload(500))
+
+    def test_edge_cases(self):
+        for case, results in EDGE_CASES.items():
+            with self.subTest(case):
+                self.assert_stream_matches({"groupData": groups_for(results)})
+
+    def test_irregular_layout(self):
+        self.assert_stream_matches({"groupData": [
+            {"name": "A", "results": [{"x": [1.0]}]},
+            {"name": "B", "results": [{"y": [2.0]}]},
+            {"name": "C", "results": [{"x": [S], "y": [3.0]}]},
+        ]})
+
+    def test_no_groups_gives_none(self):
+        self.assertIsNone(mhf.parse_widget_stream(io.BytesIO(b'{"groupData": []}')))
+
+
+if __name__ == "__main__":
+    unittest.main()
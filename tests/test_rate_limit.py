@@ -0,0 +1,38 @@
+"""
+TokenBucket rate limiting
+
+Run with:
+    python -m pytest tests/    (or: python -m unittest discover tests)
+"""
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_health_fetcher as mhf
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def timed(self, bucket, n):
+        start = time.monotonic()
+        for _ in range(n):
+            bucket.acquire()
+        return time.monotonic() - start
+
+    def test_burst_is_free_then_paced(self):
+        bucket = mhf.TokenBucket(rate=20, burst=2)
+        self.assertLess(self.timed(bucket, 2), 0.05)
+        self.assertGreaterEqual(self.timed(bucket, 2), 0.08)
+
+    def test_zero_rate_means_no_limit(self):
+        for rate in (0, -1):
+            with self.subTest(rate=rate):
+                self.assertLess(self.timed(mhf.TokenBucket(rate=rate, burst=1), 100), 0.05)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+refresh_queries / QueryCache fallback behaviour
+
+Run with:
+    python -m pytest tests/    (or: python -m unittest discover tests)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import market_health_fetcher as mhf
+
+QUERY = {"Top Losers": {"query": "q", "icon": "x", "refresh": "live"}}
+
+
+class RefreshQueriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (mhf.fetch_all_queries, mhf.query_cache)
+        mhf.query_cache = mhf.QueryCache()
+        self.replies = []
+        mhf.fetch_all_queries = lambda due: [(name, info) + self.replies.pop(0) for name, info in due.items()]
+
+    def tearDown(self):
+        mhf.fetch_all_queries, mhf.query_cache = self.saved
+
+    def refresh(self, df, error=None):
+        # Age cached entries past their TTL (but within grace) so the query is due again
+        ttl = mhf.REFRESH_TTL["live"]
+        for name, (cached_df, fetched_at) in mhf.query_cache.entries.items():
+            mhf.query_cache.entries[name] = (cached_df, fetched_at - ttl)
+        self.replies.append((df, error))
+        (result,) = mhf.refresh_queries(QUERY)
+        return result[2:]
+
+    def test_rows_are_cached(self):
+        df = pd.DataFrame({"Stock": ["A"]})
+        got, error, cached = self.refresh(df)
+        self.assertIs(got, df)
+        self.assertIsNone(error)
+        self.assertFalse(cached)
+
+    def test_error_falls_back_to_last_result(self):
+        df = pd.DataFrame({"Stock": ["A"]})
+        self.refresh(df)
+        failure = RuntimeError("boom")
+        got, error, cached = self.refresh(None, failure)
+        self.assertIs(got, df)
+        self.assertIs(error, failure)
+        self.assertTrue(cached)
+
+    def test_empty_result_replaces_old_rows(self):
+        self.refresh(pd.DataFrame({"Stock": ["A"]}))
+        got, error, cached = self.refresh(pd.DataFrame())
+        self.assertTrue(got.empty)
+        self.assertIsNone(error)
+        self.assertFalse(cached)
+
+    def test_no_groups_replaces_old_rows(self):
+        self.refresh(pd.DataFrame({"Stock": ["A"]}))
+        got, error, cached = self.refresh(None)
+        self.assertIsNone(got)
+        self.assertIsNone(error)
+        self.assertFalse(cached)
+
+    def test_error_after_empty_result_stays_empty(self):
+        self.refresh(pd.DataFrame({"Stock": ["A"]}))
+        self.refresh(pd.DataFrame())
+        got, _, cached = self.refresh(None, RuntimeError("boom"))
+        self.assertTrue(got.empty)
+        self.assertTrue(cached)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Market calendar and main-loop scheduling
+
+Run with:
+    python -m pytest tests/    (or: python -m unittest discover tests)
+"""
+
+import contextlib
+import io
+import os
+import sys
+import unittest
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import market_health_fetcher as mhf
+
+FRIDAY = date(2026, 10, 16)
+MONDAY = date(2026, 10, 19)
+HOLIDAY = date(2026, 10, 20)  # Tuesday, Diwali
+WEDNESDAY = date(2026, 10, 21)
+
+
+def at(day, hour, minute, second=0, microsecond=0):
+    return mhf.IST.localize(datetime(day.year, day.month, day.day, hour, minute, second, microsecond))
+
+
+class CalendarTest(unittest.TestCase):
+
+    def test_trading_days(self):
+        self.assertTrue(mhf.is_trading_day(FRIDAY))
+        self.assertFalse(mhf.is_trading_day(FRIDAY + timedelta(days=1)))
+        self.assertFalse(mhf.is_trading_day(FRIDAY + timedelta(days=2)))
+        self.assertFalse(mhf.is_trading_day(HOLIDAY))
+
+    def test_open_and_close_edges(self):
+        self.assertFalse(mhf.is_market_open(at(MONDAY, 9, 14, 59)))
+        self.assertTrue(mhf.is_market_open(at(MONDAY, 9, 15)))
+        self.assertTrue(mhf.is_market_open(at(MONDAY, 15, 30)))
+        self.assertFalse(mhf.is_market_open(at(MONDAY, 15, 30, 0, 1)))
+
+    def test_closed_on_weekends_and_holidays(self):
+        self.assertFalse(mhf.is_market_open(at(FRIDAY + timedelta(days=1), 11, 0)))
+        self.assertFalse(mhf.is_market_open(at(HOLIDAY, 11, 0)))
+
+    def test_next_open_same_day_before_the_open(self):
+        self.assertEqual(mhf.next_market_open(at(MONDAY, 8, 0)), at(MONDAY, 9, 15))
+
+    def test_next_open_skips_the_weekend(self):
+        self.assertEqual(mhf.next_market_open(at(FRIDAY, 16, 0)), at(MONDAY, 9, 15))
+        self.assertEqual(mhf.next_market_open(at(FRIDAY + timedelta(days=1), 9, 0)), at(MONDAY, 9, 15))
+
+    def test_next_open_skips_holidays(self):
+        self.assertEqual(mhf.next_market_open(at(MONDAY, 16, 0)), at(WEDNESDAY, 9, 15))
+        self.assertEqual(mhf.next_market_open(at(HOLIDAY, 8, 0)), at(WEDNESDAY, 9, 15))
+
+    def test_holiday_calendar_warns_for_missing_years(self):
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(mhf.check_holiday_calendar(date(2025, 6, 1)), [])
+            self.assertEqual(mhf.check_holiday_calendar(FRIDAY), ["2027"])
+            self.assertEqual(mhf.check_holiday_calendar(date(2030, 1, 1)), ["2030", "2031"])
+        self.assertIn("2030, 2031", out.getvalue())
+
+
+class CycleTimeTest(unittest.TestCase):
+
+    def test_boundaries_anchor_to_the_open(self):
+        self.assertEqual(mhf.next_cycle_time(at(MONDAY, 9, 15), 120), at(MONDAY, 9, 17))
+        self.assertEqual(mhf.next_cycle_time(at(MONDAY, 9, 15, 40), 120), at(MONDAY, 9, 17))
+        self.assertEqual(mhf.next_cycle_time(at(MONDAY, 9, 14), 120), at(MONDAY, 9, 15))
+
+    def test_last_boundary_is_the_close(self):
+        self.assertEqual(mhf.next_cycle_time(at(MONDAY, 15, 28, 10), 120), at(MONDAY, 15, 29))
+        self.assertEqual(mhf.next_cycle_time(at(MONDAY, 15, 29, 10), 120), at(MONDAY, 15, 30))
+
+    def test_full_session_schedule(self):
+        wakes = [at(MONDAY, 9, 15)]
+        while wakes[-1] < at(MONDAY, 15, 30):
+            wakes.append(mhf.next_cycle_time(wakes[-1] + timedelta(seconds=20), 120))
+        gaps = {(b - a).total_seconds() for a, b in zip(wakes[:-2], wakes[1:-1])}
+        self.assertEqual(gaps, {120})
+        self.assertEqual(wakes[-2:], [at(MONDAY, 15, 29), at(MONDAY, 15, 30)])
+
+    def test_slow_cycle_skips_to_the_next_boundary(self):
+        self.assertEqual(mhf.next_cycle_time(at(MONDAY, 10, 0, 30), 120), at(MONDAY, 10, 1))
+
+
+class NextActionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = (mhf.POST_CLOSE_SNAPSHOT, mhf.POST_CLOSE_DELAY, mhf.POST_CLOSE_WINDOW)
+        mhf.POST_CLOSE_SNAPSHOT, mhf.POST_CLOSE_DELAY, mhf.POST_CLOSE_WINDOW = True, 300, 1800
+
+    def tearDown(self):
+        mhf.POST_CLOSE_SNAPSHOT, mhf.POST_CLOSE_DELAY, mhf.POST_CLOSE_WINDOW = self.saved
+
+    def test_cycle_while_open(self):
+        self.assertEqual(mhf.next_action(at(MONDAY, 9, 15)), ("cycle", None))
+        self.assertEqual(mhf.next_action(at(MONDAY, 15, 30)), ("cycle", None))
+
+    def test_late_wake_up_still_runs_the_close_cycle(self):
+        close = at(MONDAY, 15, 30)
+        now = mhf.on_schedule(close + timedelta(microseconds=2500), close)
+        self.assertEqual(mhf.next_action(now), ("cycle", None))
+
+    def test_on_schedule_only_snaps_just_past_the_wake(self):
+        wake = at(MONDAY, 10, 0)
+        self.assertEqual(mhf.on_schedule(wake + timedelta(seconds=1), wake), wake)
+        self.assertEqual(mhf.on_schedule(wake + timedelta(seconds=30), wake), wake + timedelta(seconds=30))
+        self.assertEqual(mhf.on_schedule(wake - timedelta(seconds=1), wake), wake - timedelta(seconds=1))
+        self.assertEqual(mhf.on_schedule(wake, None), wake)
+
+    def test_waits_for_the_post_close_snapshot(self):
+        self.assertEqual(mhf.next_action(at(MONDAY, 15, 31)), ("wait", at(MONDAY, 15, 35)))
+
+    def test_post_close_snapshot_inside_the_window(self):
+        self.assertEqual(mhf.next_action(at(MONDAY, 15, 35)), ("post_close", None))
+        self.assertEqual(mhf.next_action(at(MONDAY, 16, 4)), ("post_close", None))
+
+    def test_post_close_snapshot_runs_once(self):
+        self.assertEqual(mhf.next_action(at(MONDAY, 15, 36), MONDAY), ("closed", at(WEDNESDAY, 9, 15)))
+
+    def test_late_restart_skips_the_post_close_snapshot(self):
+        self.assertEqual(mhf.next_action(at(MONDAY, 16, 5)), ("closed", at(WEDNESDAY, 9, 15)))
+        self.assertEqual(mhf.next_action(at(MONDAY, 20, 0)), ("closed", at(WEDNESDAY, 9, 15)))
+
+    def test_post_close_snapshot_can_be_disabled(self):
+        mhf.POST_CLOSE_SNAPSHOT = False
+        self.assertEqual(mhf.next_action(at(FRIDAY, 15, 40)), ("closed", at(MONDAY, 9, 15)))
+
+    def test_no_post_close_snapshot_on_holidays_or_weekends(self):
+        self.assertEqual(mhf.next_action(at(HOLIDAY, 15, 40)), ("closed", at(WEDNESDAY, 9, 15)))
+        self.assertEqual(mhf.next_action(at(FRIDAY + timedelta(days=1), 15, 40)), ("closed", at(MONDAY, 9, 15)))
+
+    def test_before_the_open(self):
+        self.assertEqual(mhf.next_action(at(MONDAY, 9, 14, 59)), ("closed", at(MONDAY, 9, 15)))
+
+
+if __name__ == "__main__":
+    unittest.main()